@@ -9,6 +9,10 @@ import pandas as pd
 from scipy.spatial.distance import cosine
 from scipy.spatial.distance import cdist
 
+from src.food_data_central.hdf_store import read_fdc_data
+from src.my_pandas.multi_index import flatten_columns_inplace
+from src.my_mlflow.stage_tracking import tracked_stage
+
 parser = argparse.ArgumentParser()
 parser.add_argument("--similarity_threshold", type=float, default=0.5)
 parser.add_argument("--chroma_path", type=str, default="data/processed/chroma.db")
@@ -50,6 +54,7 @@ def load_chroma_collection(client_path, collection_name):
     return df
 
 
+@tracked_stage()
 def merge_embeddings_on_similarity(df1, df2, similarity_column_name="similarity"):
     """
     Merges two dataframes based on the similarity of their embeddings.
@@ -111,7 +116,10 @@ def main(args):
     df1 = pd.read_csv(args.df1_path)
     df1.columns = ["Non Nutrient Data." + col for col in df1.columns]
 
-    df2 = pd.read_csv(args.df2_path)
+    if args.df2_path.endswith(".h5"):
+        df2 = flatten_columns_inplace(read_fdc_data(args.df2_path))
+    else:
+        df2 = pd.read_csv(args.df2_path)
 
     merged_df1 = merged_collections.merge(
         df1, left_on=args.left_on, right_on=args.column1, how="left"
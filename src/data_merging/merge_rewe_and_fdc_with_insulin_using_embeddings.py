@@ -7,6 +7,8 @@ import numpy as np
 import pandas as pd
 from scipy.spatial.distance import cdist
 
+from src.my_mlflow.stage_tracking import tracked_stage
+
 
 def load_chroma_collection(client_path, collection_name):
     chroma = chromadb.PersistentClient(path=client_path)
@@ -25,6 +27,7 @@ def load_chroma_collection(client_path, collection_name):
     return df
 
 
+@tracked_stage()
 def merge_embeddings_on_similarity(df1, df2):
     # Resetting indices to ensure they are sequential
     df1 = df1.reset_index(drop=True)
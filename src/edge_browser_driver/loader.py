@@ -3,8 +3,8 @@ from selenium.webdriver.edge.options import Options
 from selenium.webdriver.edge.service import Service
 
 
-def load_driver(edge_options_dict):
-
+def load_driver(edge_options_dict, open_url=True):
+    # With open_url=False the session attaches to the browser without navigating
     print(edge_options_dict)
 
     edge_options = Options()
@@ -15,5 +15,6 @@ def load_driver(edge_options_dict):
 
     service = Service(edge_options_dict["edge_driver_path"])
     driver = webdriver.Edge(service=service, options=edge_options)
-    driver.get(f"{edge_options_dict['url']}")
+    if open_url:
+        driver.get(f"{edge_options_dict['url']}")
     return driver
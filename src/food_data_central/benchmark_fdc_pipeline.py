@@ -0,0 +1,181 @@
+import os
+import json
+import time
+import shutil
+import argparse
+import platform
+import pandas as pd
+
+from src.my_mlflow.benchmarking import get_git_commit, run_stage
+from src.food_data_central.cache import build_fdc_cache, get_release_cache_dir
+from src.food_data_central.loader import (
+    load_food_dataframe,
+    load_food_category_dataframe,
+    load_nutrient_dataframe,
+    load_food_nutrient_dataframe,
+    rotate_nutrient_rows_to_columns,
+    merge_dataframes,
+    clean_fdc_data,
+)
+from src.food_data_central.synthetic_release import generate_synthetic_fdc_release
+
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--scales",
+    help="Sizes of the synthetic releases, as multiples of SR Legacy",
+    type=float,
+    nargs="+",
+    default=[1, 10, 100],
+)
+parser.add_argument(
+    "--work_dir",
+    help="Folder for the synthetic releases and their cache",
+    type=str,
+    default="data/benchmark/fdc",
+)
+parser.add_argument("--output_dir", type=str, default="outputs/benchmarks")
+parser.add_argument(
+    "--baseline_path",
+    help="Results of an earlier run to compare the stage timings with",
+    type=str,
+    default=None,
+)
+parser.add_argument("--repeat", help="Timed runs per stage", type=int, default=3)
+parser.add_argument("--seed", type=int, default=0)
+parser.add_argument(
+    "--no_cache",
+    help="Benchmark the loaders on the raw csv files instead of the parquet cache",
+    action="store_true",
+    default=False,
+)
+
+args = parser.parse_args()
+
+
+def benchmark_release(path, cache_dir, repeat):
+    stages = {}
+    if cache_dir is not None:
+        # Always time a cold conversion of the raw csv files into the cache
+        shutil.rmtree(get_release_cache_dir(path, cache_dir), ignore_errors=True)
+        start = time.perf_counter()
+        build_fdc_cache(path, cache_dir=cache_dir)
+        stages["build_fdc_cache"] = {"wall_time_s": time.perf_counter() - start}
+
+    food_df, stages["load_food_dataframe"] = run_stage(
+        "load_food_dataframe",
+        load_food_dataframe,
+        path,
+        cache_dir=cache_dir,
+        repeat=repeat,
+    )
+    food_category_df, stages["load_food_category_dataframe"] = run_stage(
+        "load_food_category_dataframe",
+        load_food_category_dataframe,
+        path,
+        cache_dir=cache_dir,
+        repeat=repeat,
+    )
+    nutrient_df, stages["load_nutrient_dataframe"] = run_stage(
+        "load_nutrient_dataframe",
+        load_nutrient_dataframe,
+        path,
+        cache_dir=cache_dir,
+        repeat=repeat,
+    )
+    food_nutrient_df, stages["load_food_nutrient_dataframe"] = run_stage(
+        "load_food_nutrient_dataframe",
+        load_food_nutrient_dataframe,
+        path,
+        fdc_ids=food_df["fdc_id"],
+        cache_dir=cache_dir,
+        repeat=repeat,
+    )
+
+    categorized_food_df = pd.merge(
+        food_df, food_category_df, on="food_category_id", how="inner"
+    )
+    _, stages["rotate_nutrient_rows_to_columns"] = run_stage(
+        "rotate_nutrient_rows_to_columns",
+        rotate_nutrient_rows_to_columns,
+        categorized_food_df,
+        food_nutrient_df,
+        nutrient_df,
+        repeat=repeat,
+    )
+    merged_df, stages["merge_dataframes"] = run_stage(
+        "merge_dataframes",
+        merge_dataframes,
+        food_df,
+        food_category_df,
+        food_nutrient_df,
+        nutrient_df,
+        repeat=repeat,
+    )
+    _, stages["clean_fdc_data"] = run_stage(
+        "clean_fdc_data", clean_fdc_data, merged_df, repeat=repeat
+    )
+    return stages
+
+
+def compare_with_baseline(results, baseline, tolerance=0.2):
+    """Print the stages that got more than tolerance slower than in the baseline."""
+    baseline_stages = {
+        run["scale"]: run["stages"] for run in baseline.get("releases", [])
+    }
+    for run in results["releases"]:
+        if run["scale"] not in baseline_stages:
+            continue
+        print(f"Scale {run['scale']:g} compared with {baseline.get('commit')}:")
+        for name, stats in run["stages"].items():
+            previous = baseline_stages[run["scale"]].get(name)
+            if previous is None:
+                continue
+            ratio = stats["wall_time_s"] / max(previous["wall_time_s"], 1e-9)
+            flag = "  REGRESSION" if ratio > 1 + tolerance else ""
+            print(f"  {name:<35} {ratio:6.2f}x{flag}")
+
+
+def main():
+    results = {
+        "commit": get_git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "cache": not args.no_cache,
+        "repeat": args.repeat,
+        "releases": [],
+    }
+
+    for scale in args.scales:
+        path = os.path.join(args.work_dir, f"synthetic_sr_legacy_x{scale:g}")
+        if not os.path.isfile(os.path.join(path, "food_nutrient.csv")):
+            print(f"Generating synthetic release at {path}")
+            release_info = generate_synthetic_fdc_release(
+                path, scale=scale, seed=args.seed
+            )
+        else:
+            release_info = {
+                "n_foods": len(pd.read_csv(os.path.join(path, "food.csv"))),
+            }
+
+        print(f"Scale {scale:g} ({release_info['n_foods']} foods)")
+        cache_dir = None if args.no_cache else os.path.join(args.work_dir, "cache")
+        stages = benchmark_release(path, cache_dir, args.repeat)
+        results["releases"].append({"scale": scale, **release_info, "stages": stages})
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    output_path = os.path.join(
+        args.output_dir,
+        f"fdc_pipeline_{time.strftime('%Y%m%d_%H%M%S')}_{results['commit']}.json",
+    )
+    with open(output_path, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {output_path}")
+
+    if args.baseline_path is not None:
+        with open(args.baseline_path, "r") as f:
+            compare_with_baseline(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
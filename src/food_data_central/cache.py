@@ -0,0 +1,206 @@
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+FDC_CACHE_DIR = "data/processed/fdc_cache"
+FDC_CHUNKSIZE = 1_000_000
+
+# Columns and dtypes that the loaders actually use from each raw FDC table.
+# Tables that are not listed here are cached with all columns.
+FDC_TABLE_SCHEMAS = {
+    "food.csv": {
+        "usecols": ["fdc_id", "data_type", "description", "food_category_id"],
+        "dtype": {
+            "fdc_id": "int32",
+            "data_type": "category",
+            "description": "object",
+            "food_category_id": "Int32",
+        },
+    },
+    "food_category.csv": {
+        "usecols": ["id", "description"],
+        "dtype": {"id": "int32", "description": "object"},
+    },
+    "food_nutrient.csv": {
+        "usecols": ["fdc_id", "nutrient_id", "amount"],
+        "dtype": {"fdc_id": "int32", "nutrient_id": "int32", "amount": "float64"},
+    },
+}
+
+
+def hash_file(file_path, block_size=1 << 20):
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for block in iter(lambda: file.read(block_size), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def get_release_cache_dir(path, cache_dir=FDC_CACHE_DIR):
+    release_name = os.path.basename(os.path.normpath(path))
+    return os.path.join(cache_dir, release_name)
+
+
+def load_cached_file_hash(csv_path, release_cache_dir):
+    """
+    Hash a raw release file, reusing the hash from the release manifest
+    as long as the file's size and modification time did not change.
+    """
+    manifest_path = os.path.join(release_cache_dir, "manifest.json")
+    manifest = {}
+    if os.path.isfile(manifest_path):
+        with open(manifest_path, "r") as f:
+            manifest = json.load(f)
+
+    stat = os.stat(csv_path)
+    file_name = os.path.basename(csv_path)
+    entry = manifest.get(file_name)
+    if (
+        entry
+        and entry["size"] == stat.st_size
+        and entry["mtime_ns"] == stat.st_mtime_ns
+    ):
+        return entry["sha256"]
+
+    file_hash = hash_file(csv_path)
+    manifest[file_name] = {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sha256": file_hash,
+    }
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    return file_hash
+
+
+def get_cache_path(path, file_name, cache_dir=FDC_CACHE_DIR):
+    """
+    The cache file is keyed by the release folder name, the hash of the raw
+    csv file and the schema it was converted with, so that a new release or
+    a schema change never reads a stale cache.
+    """
+    release_cache_dir = get_release_cache_dir(path, cache_dir)
+    os.makedirs(release_cache_dir, exist_ok=True)
+
+    file_hash = load_cached_file_hash(os.path.join(path, file_name), release_cache_dir)
+    schema = FDC_TABLE_SCHEMAS.get(file_name, {})
+    key = hashlib.sha256(
+        (file_hash + json.dumps(schema, sort_keys=True)).encode("utf-8")
+    ).hexdigest()[:16]
+
+    stem = os.path.splitext(file_name)[0]
+    return os.path.join(release_cache_dir, f"{stem}-{key}.parquet")
+
+
+def read_fdc_csv(path, file_name, **kwargs):
+    schema = FDC_TABLE_SCHEMAS.get(file_name, {})
+    return pd.read_csv(os.path.join(path, file_name), **schema, **kwargs)
+
+
+def convert_fdc_csv_to_parquet(path, file_name, cache_path, chunksize=FDC_CHUNKSIZE):
+    """
+    Convert a raw FDC csv into a typed, column-pruned parquet file.
+    The csv is read in chunks, so the conversion itself never holds more than
+    one chunk of the raw table in memory.
+    """
+    tmp_path = f"{cache_path}.tmp"
+    writer = None
+    for chunk in read_fdc_csv(path, file_name, chunksize=chunksize):
+        table = pa.Table.from_pandas(chunk, preserve_index=False)
+        if writer is None:
+            writer = pq.ParquetWriter(tmp_path, table.schema)
+        writer.write_table(table.cast(writer.schema))
+
+    if writer is None:
+        empty_df = read_fdc_csv(path, file_name, nrows=0)
+        pq.write_table(pa.Table.from_pandas(empty_df, preserve_index=False), tmp_path)
+    else:
+        writer.close()
+    os.replace(tmp_path, cache_path)
+
+    # Remove caches of previous versions of this file
+    stem = os.path.splitext(file_name)[0]
+    cache_folder = os.path.dirname(cache_path)
+    for cached_file in os.listdir(cache_folder):
+        if (
+            cached_file.startswith(f"{stem}-")
+            and cached_file.endswith(".parquet")
+            and cached_file != os.path.basename(cache_path)
+        ):
+            os.remove(os.path.join(cache_folder, cached_file))
+
+
+def filter_dataframe(df, filters=None):
+    """
+    Apply filters in the (column, operator, value) format of pyarrow
+    to a DataFrame. Supported operators are "==" and "in".
+    """
+    if filters is None:
+        return df
+
+    mask = np.ones(len(df), dtype=bool)
+    for column, operator, value in filters:
+        if operator == "==":
+            mask &= (df[column] == value).to_numpy()
+        elif operator == "in":
+            mask &= df[column].isin(value).to_numpy()
+        else:
+            raise ValueError(f"Unsupported filter operator: {operator}")
+    return df[mask]
+
+
+def load_fdc_cache_path(path, file_name, cache_dir=FDC_CACHE_DIR):
+    cache_path = get_cache_path(path, file_name, cache_dir)
+    if not os.path.isfile(cache_path):
+        print(f"Building FDC cache for {os.path.join(path, file_name)}")
+        convert_fdc_csv_to_parquet(path, file_name, cache_path)
+    return cache_path
+
+
+def build_fdc_cache(path, cache_dir=FDC_CACHE_DIR):
+    for file_name in [
+        "food.csv",
+        "food_category.csv",
+        "food_nutrient.csv",
+        "nutrient.csv",
+    ]:
+        load_fdc_cache_path(path, file_name, cache_dir)
+
+
+def read_fdc_table(path, file_name, cache_dir=FDC_CACHE_DIR, filters=None):
+    """
+    Read one table of a raw FDC release.
+    On the first read the csv is converted into a parquet cache,
+    all later reads load the cache instead of re-parsing the csv.
+    Pass cache_dir=None to read the csv directly.
+    Filters are pushed down into the parquet read.
+    """
+    if cache_dir is None:
+        return filter_dataframe(read_fdc_csv(path, file_name), filters)
+
+    cache_path = load_fdc_cache_path(path, file_name, cache_dir)
+    return pd.read_parquet(cache_path, filters=filters)
+
+
+def iter_fdc_table(
+    path, file_name, cache_dir=FDC_CACHE_DIR, filters=None, chunksize=FDC_CHUNKSIZE
+):
+    """
+    Stream one table of a raw FDC release in chunks of at most chunksize rows,
+    so that only the filtered rows of one chunk are held in memory at a time.
+    """
+    if cache_dir is None:
+        for chunk in read_fdc_csv(path, file_name, chunksize=chunksize):
+            yield filter_dataframe(chunk, filters)
+        return
+
+    cache_path = load_fdc_cache_path(path, file_name, cache_dir)
+    dataset = ds.dataset(cache_path, format="parquet")
+    expression = None if filters is None else pq.filters_to_expression(filters)
+    for batch in dataset.to_batches(filter=expression, batch_size=chunksize):
+        yield batch.to_pandas()
@@ -0,0 +1,130 @@
+import re
+import pandas as pd
+
+FDC_DATA_KEY = "nutrition"
+
+# Columns that are indexed in the HDF5 table and can be used in where queries
+FDC_DATA_COLUMNS = [
+    ("Non Nutrient Data", "FDC Name"),
+    ("Non Nutrient Data", "Food Category"),
+    ("Energy", "Energy [KCAL]"),
+    ("Macronutrient", "Protein [G]"),
+    ("Macronutrient", "Carbohydrate [G]"),
+    ("Macronutrient", "Total Fat [G]"),
+]
+
+
+def to_store_column(column):
+    """
+    PyTables can only query columns whose names are valid identifiers,
+    e.g. ("Energy", "Energy [KCAL]") is stored as "Energy_Energy_KCAL".
+    """
+    return re.sub(r"\W+", "_", ".".join(column)).strip("_")
+
+
+def write_fdc_data(df, path, key=FDC_DATA_KEY, format="table"):
+    """
+    Write the processed FDC table to an HDF5 file.
+
+    In "table" format the MultiIndex columns are flattened into identifiers,
+    FDC_DATA_COLUMNS become indexed data columns and the original column
+    tuples are kept in the table attributes, so that read_fdc_data can run
+    where-filtered, column-projected queries without loading the whole table.
+    The "fixed" format writes the table as before.
+    """
+    if format == "fixed":
+        df.to_hdf(path, key=key, mode="w")
+        return
+
+    store_columns = [to_store_column(col) for col in df.columns]
+    if len(set(store_columns)) != len(store_columns):
+        raise ValueError("Column names are not unique after flattening")
+
+    store_df = df.reset_index(drop=True)
+    store_df.columns = store_columns
+    data_columns = [
+        to_store_column(col) for col in FDC_DATA_COLUMNS if col in df.columns
+    ]
+
+    with pd.HDFStore(path, mode="w") as store:
+        store.put(key, store_df, format="table", data_columns=data_columns)
+        store.get_storer(key).attrs.fdc_columns = list(df.columns)
+
+
+def get_prefix_condition(column, prefix):
+    """Turn a string prefix into a range query that can use the column index."""
+    upper_bound = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    return f"({column} >= {prefix!r}) & ({column} < {upper_bound!r})"
+
+
+def read_fdc_data(
+    path,
+    food_category=None,
+    name_prefix=None,
+    columns=None,
+    where=None,
+    key=FDC_DATA_KEY,
+):
+    """
+    Read the processed FDC table, optionally only some rows and columns.
+
+    food_category: one category or a list of categories
+    name_prefix: only foods whose FDC Name starts with this prefix
+    columns: column tuples or column groups like "Macronutrient"
+    where: additional PyTables condition on the indexed columns,
+        use to_store_column to get their names
+
+    On tables written in "fixed" format, the filters are applied in memory.
+    """
+    with pd.HDFStore(path, mode="r") as store:
+        storer = store.get_storer(key)
+        if not storer.is_table:
+            return filter_fdc_data(
+                store.select(key), food_category, name_prefix, columns
+            )
+
+        fdc_columns = pd.MultiIndex.from_tuples(storer.attrs.fdc_columns)
+
+        conditions = []
+        if food_category is not None:
+            category_column = to_store_column(("Non Nutrient Data", "Food Category"))
+            if isinstance(food_category, str):
+                food_category = [food_category]
+            conditions.append(f"{category_column} = {list(food_category)!r}")
+        if name_prefix:
+            name_column = to_store_column(("Non Nutrient Data", "FDC Name"))
+            conditions.append(get_prefix_condition(name_column, name_prefix))
+        if where is not None:
+            conditions.append(f"({where})")
+
+        if columns is not None:
+            fdc_columns = select_fdc_columns(fdc_columns, columns)
+
+        df = store.select(
+            key,
+            where=" & ".join(conditions) if conditions else None,
+            columns=[to_store_column(col) for col in fdc_columns],
+        )
+
+    df.columns = fdc_columns
+    return df
+
+
+def select_fdc_columns(fdc_columns, columns):
+    groups = [col for col in columns if isinstance(col, str)]
+    tuples = [tuple(col) for col in columns if not isinstance(col, str)]
+    return fdc_columns[
+        fdc_columns.get_level_values(0).isin(groups) | fdc_columns.isin(tuples)
+    ]
+
+
+def filter_fdc_data(df, food_category=None, name_prefix=None, columns=None):
+    if food_category is not None:
+        if isinstance(food_category, str):
+            food_category = [food_category]
+        df = df[df[("Non Nutrient Data", "Food Category")].isin(food_category)]
+    if name_prefix:
+        df = df[df[("Non Nutrient Data", "FDC Name")].str.startswith(name_prefix)]
+    if columns is not None:
+        df = df[select_fdc_columns(df.columns, columns)]
+    return df
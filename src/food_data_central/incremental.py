@@ -0,0 +1,221 @@
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+
+from src.food_data_central.cache import FDC_CACHE_DIR, FDC_CHUNKSIZE
+from src.food_data_central.hdf_store import read_fdc_data, write_fdc_data
+from src.food_data_central.loader import (
+    load_food_dataframe,
+    load_food_category_dataframe,
+    load_nutrient_dataframe,
+    iter_food_nutrient_chunks,
+    merge_dataframes,
+    clean_fdc_data,
+    load_fdc_cleaning_rules,
+)
+
+# Bump when the merging, pivoting or cleaning code in loader.py changes
+FDC_INCREMENTAL_CODE_VERSION = 1
+
+
+def get_state_path(output_path):
+    return f"{os.path.splitext(output_path)[0]}_state.parquet"
+
+
+def get_changeset_path(output_path):
+    return f"{os.path.splitext(output_path)[0]}_changeset.csv"
+
+
+def get_fdc_rules_version(rules):
+    """Hash of the cleaning rules and the code version the output depends on."""
+    rules = {"rules": rules, "code_version": FDC_INCREMENTAL_CODE_VERSION}
+    return hashlib.sha256(
+        json.dumps(rules, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    ).hexdigest()[:16]
+
+
+def hash_food_contents(path, food_df, nutrient_df, cache_dir, chunksize):
+    """
+    Compute one content hash per food of food_df.
+
+    The hash combines the food row (name, category), all of its nutrient rows
+    and the standardized nutrient table. Row hashes are added up modulo 2**64,
+    so the result does not depend on the order in which the rows are read.
+    A change of the nutrient table therefore changes the hash of every food.
+    """
+    with np.errstate(over="ignore"):
+        nutrient_table_hash = np.uint64(
+            pd.util.hash_pandas_object(nutrient_df, index=False).sum()
+        )
+        content_hashes = pd.util.hash_pandas_object(
+            food_df[["fdc_id", "FDC Name", "Food Category"]], index=False
+        ).to_numpy()
+        content_hashes = content_hashes + nutrient_table_hash
+
+        food_index = pd.Index(food_df["fdc_id"])
+        for food_nutrient_df in iter_food_nutrient_chunks(
+            path, fdc_ids=food_df["fdc_id"], cache_dir=cache_dir, chunksize=chunksize
+        ):
+            row_hashes = pd.util.hash_pandas_object(
+                food_nutrient_df[["fdc_id", "Nutrient ID", "Nutrient Amount [G]"]],
+                index=False,
+            ).to_numpy()
+            food_codes = food_index.get_indexer(food_nutrient_df["fdc_id"])
+            np.add.at(content_hashes, food_codes, row_hashes)
+
+    return pd.DataFrame(
+        {
+            "fdc_id": food_df["fdc_id"].to_numpy(),
+            "FDC Name": food_df["FDC Name"].to_numpy(),
+            "Content Hash": pd.array(content_hashes, dtype="UInt64"),
+        }
+    )
+
+
+def diff_fdc_states(previous_state, state):
+    """
+    Compare two food states by fdc_id and content hash.
+    Returns the changeset with one row per added, changed or removed food.
+    """
+    diff = pd.merge(
+        previous_state,
+        state,
+        on="fdc_id",
+        how="outer",
+        suffixes=(" Previous", ""),
+        indicator=True,
+    )
+    diff["Change"] = None
+    diff.loc[diff["_merge"] == "right_only", "Change"] = "added"
+    diff.loc[diff["_merge"] == "left_only", "Change"] = "removed"
+    diff.loc[
+        (diff["_merge"] == "both")
+        & (diff["Content Hash Previous"] != diff["Content Hash"]),
+        "Change",
+    ] = "changed"
+
+    diff["FDC Name"] = diff["FDC Name"].fillna(diff["FDC Name Previous"])
+    changeset = diff.loc[diff["Change"].notna(), ["fdc_id", "FDC Name", "Change"]]
+    return changeset.reset_index(drop=True)
+
+
+def combine_with_previous_output(previous_df, recomputed_df, unchanged_names, names):
+    """
+    Keep the rows of unchanged foods from the previous output, add the
+    recomputed rows and order everything like the foods of the new release.
+    Nutrient columns that only one side has are filled with 0,
+    like missing nutrients in the pivot.
+    """
+    name_column = ("Non Nutrient Data", "FDC Name")
+    previous_df = previous_df[previous_df[name_column].isin(unchanged_names)]
+    if recomputed_df is None:
+        recomputed_df = previous_df.iloc[:0]
+
+    columns = previous_df.columns.append(
+        recomputed_df.columns.difference(previous_df.columns, sort=False)
+    )
+    df = pd.concat([previous_df, recomputed_df], ignore_index=True)[columns]
+
+    nutrient_columns = [col for col in columns if col[0] != "Non Nutrient Data"]
+    df[nutrient_columns] = df[nutrient_columns].fillna(0)
+
+    order = pd.Index(names).get_indexer(df[name_column])
+    df = df.iloc[np.argsort(order, kind="stable")].reset_index(drop=True)
+    return df
+
+
+def refresh_fdc_data(
+    path: str,
+    output_path: str,
+    cache_dir=FDC_CACHE_DIR,
+    data_type="sr_legacy_food",
+    chunksize=FDC_CHUNKSIZE,
+    output_format="table",
+):
+    """
+    Incrementally update the processed FDC table at output_path with a new release.
+
+    The foods of the release are diffed against the state of the last run by
+    fdc_id and content hash. Only added and changed foods are merged, pivoted
+    and cleaned, the rows of unchanged foods are taken over from the previous
+    output. Next to the output, the new state and a changeset csv with the
+    added, changed and removed foods are written, so that later stages can
+    restrict their own work to the changed foods.
+    Without a previous output and state, or if the cleaning rules or the
+    code version changed since the last run, the whole release is processed.
+    """
+    rules = load_fdc_cleaning_rules()
+    rules_version = get_fdc_rules_version(rules)
+
+    food_df = load_food_dataframe(path, cache_dir=cache_dir, data_type=data_type)
+    food_category_df = load_food_category_dataframe(path, cache_dir=cache_dir)
+    nutrient_df = load_nutrient_dataframe(path, cache_dir=cache_dir)
+
+    categorized_food_df = pd.merge(
+        food_df, food_category_df, on="food_category_id", how="inner"
+    )
+    state = hash_food_contents(
+        path, categorized_food_df, nutrient_df, cache_dir, chunksize
+    )
+    # Checked before anything is written, so the last state and output stay
+    if len(state) == 0:
+        raise ValueError(f"No {data_type} foods with a category found in {path}")
+
+    state_path = get_state_path(output_path)
+    if os.path.isfile(state_path) and os.path.isfile(output_path):
+        previous_state = pd.read_parquet(state_path)
+        is_outdated = "Rules Version" not in previous_state or (
+            (previous_state["Rules Version"] != rules_version).any()
+        )
+        previous_state = previous_state[["fdc_id", "FDC Name", "Content Hash"]].astype(
+            {"Content Hash": "UInt64"}
+        )
+        previous_df = None if is_outdated else read_fdc_data(output_path)
+    else:
+        previous_state = state.iloc[:0]
+        is_outdated = False
+        previous_df = None
+
+    changeset = diff_fdc_states(previous_state, state)
+    if is_outdated:
+        # Rows cleaned under other rules or code are not reused
+        print("FDC cleaning rules or code changed, processing the whole release")
+        unchanged = state.loc[
+            state["fdc_id"].isin(previous_state["fdc_id"])
+            & ~state["fdc_id"].isin(changeset["fdc_id"]),
+            ["fdc_id", "FDC Name"],
+        ]
+        changeset = pd.concat(
+            [changeset, unchanged.assign(Change="changed")], ignore_index=True
+        )
+    recompute_ids = changeset.loc[
+        changeset["Change"].isin(["added", "changed"]), "fdc_id"
+    ]
+    print(
+        f"FDC changeset: {changeset['Change'].value_counts().to_dict()}, "
+        f"{len(state) - len(recompute_ids)} foods unchanged"
+    )
+
+    df = None
+    if len(recompute_ids) > 0:
+        recompute_food_df = food_df[food_df["fdc_id"].isin(recompute_ids)]
+        food_nutrient_chunks = iter_food_nutrient_chunks(
+            path, fdc_ids=recompute_ids, cache_dir=cache_dir, chunksize=chunksize
+        )
+        df = merge_dataframes(
+            recompute_food_df, food_category_df, food_nutrient_chunks, nutrient_df
+        )
+        df = clean_fdc_data(df, rules)
+
+    if previous_df is not None:
+        unchanged_names = state.loc[~state["fdc_id"].isin(recompute_ids), "FDC Name"]
+        df = combine_with_previous_output(
+            previous_df, df, unchanged_names, state["FDC Name"]
+        )
+
+    write_fdc_data(df, output_path, format=output_format)
+    state.assign(**{"Rules Version": rules_version}).to_parquet(state_path, index=False)
+    changeset.to_csv(get_changeset_path(output_path), index=False)
+    return df, changeset
@@ -1,123 +1,100 @@
 import requests
 import os
+import numpy as np
 import pandas as pd
 from tqdm import tqdm
-
-
-def load_food_dataframe(path: str) -> pd.DataFrame:
-    food_df = pd.read_csv(os.path.join(path, "food.csv"))
-    # food_df = food_df.loc[food_df["data_type"] == "foundation_food"]
-    food_df = food_df.loc[food_df["data_type"] == "sr_legacy_food"]
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+
+from src.food_data_central.cache import (
+    FDC_CACHE_DIR,
+    FDC_CHUNKSIZE,
+    build_fdc_cache,
+    read_fdc_table,
+    iter_fdc_table,
+)
+from src.config.loader import load_file
+from src.my_mlflow.stage_tracking import tracked_stage
+from src.food_data_central.nutrient_names import (
+    MACRO_CATEGORIES,
+    MICRO_CATEGORIES,
+    nutrient_name_classifier,
+)
+
+FDC_CLEANING_RULES_PATH = "config/fdc/clean_fdc_data.yaml"
+
+
+def load_food_dataframe(
+    path: str, cache_dir=FDC_CACHE_DIR, data_type="sr_legacy_food"
+) -> pd.DataFrame:
+    # data_type: "sr_legacy_food", "foundation_food", "branded_food", ...
+    food_df = read_fdc_table(
+        path, "food.csv", cache_dir=cache_dir, filters=[("data_type", "==", data_type)]
+    )
 
     food_df = food_df.drop_duplicates(subset="description", keep="first")
     food_df.rename(columns={"description": "FDC Name"}, inplace=True)
-    food_df.drop(columns=["data_type", "publication_date"], inplace=True)
+    food_df.drop(columns=["data_type"], inplace=True)
     food_df.reset_index(drop=True, inplace=True)
     return food_df
 
 
-def load_food_category_dataframe(path: str) -> pd.DataFrame:
-    food_category_df = pd.read_csv(os.path.join(path, "food_category.csv"))
+def load_food_category_dataframe(path: str, cache_dir=FDC_CACHE_DIR) -> pd.DataFrame:
+    food_category_df = read_fdc_table(path, "food_category.csv", cache_dir=cache_dir)
     food_category_df.rename(
         columns={"description": "Food Category", "id": "food_category_id"}, inplace=True
     )
-    food_category_df.drop(columns=["code"], inplace=True)
     return food_category_df
 
 
-def load_food_nutrient_dataframe(path: str) -> pd.DataFrame:
-    food_nutrient_df = pd.read_csv(os.path.join(path, "food_nutrient.csv"))
-    food_nutrient_df = food_nutrient_df[["fdc_id", "nutrient_id", "amount"]]
-    food_nutrient_df.rename(
-        columns={"nutrient_id": "Nutrient ID", "amount": "Nutrient Amount [G]"},
-        inplace=True,
+def iter_food_nutrient_chunks(
+    path: str, fdc_ids=None, cache_dir=FDC_CACHE_DIR, chunksize=FDC_CHUNKSIZE
+):
+    """
+    Stream food_nutrient.csv in chunks.
+    If fdc_ids are given, only the nutrient rows of these foods are read.
+    """
+    filters = None if fdc_ids is None else [("fdc_id", "in", np.unique(fdc_ids))]
+
+    for food_nutrient_df in iter_fdc_table(
+        path,
+        "food_nutrient.csv",
+        cache_dir=cache_dir,
+        filters=filters,
+        chunksize=chunksize,
+    ):
+        food_nutrient_df = food_nutrient_df.rename(
+            columns={"nutrient_id": "Nutrient ID", "amount": "Nutrient Amount [G]"},
+        )
+        food_nutrient_df["Nutrient Amount [G]"] = food_nutrient_df[
+            "Nutrient Amount [G]"
+        ].clip(lower=0)
+        yield food_nutrient_df
+
+
+def load_food_nutrient_dataframe(
+    path: str, fdc_ids=None, cache_dir=FDC_CACHE_DIR
+) -> pd.DataFrame:
+    return pd.concat(
+        iter_food_nutrient_chunks(path, fdc_ids=fdc_ids, cache_dir=cache_dir),
+        ignore_index=True,
     )
-    food_nutrient_df["Nutrient Amount [G]"] = food_nutrient_df[
-        "Nutrient Amount [G]"
-    ].clip(lower=0)
-    return food_nutrient_df
-
-
-def load_nutrient_dataframe(path):
-    # Load the nutrient data from a CSV file
-    nutrient_df = pd.read_csv(os.path.join(path, "nutrient.csv"))
-
-    # Lookup table for standardizing names with regex patterns
-    lookup_table = {
-        "Vitamin A": ["Vitamin A, RAE", r"Vitamin A, RAE.*"],
-        "Vitamin B-6": ["Vitamin B-6", r"Vitamin B-6.*"],
-        "Vitamin B-12": ["Vitamin B-12", r"Vitamin B-12.*"],
-        "Vitamin C": ["Vitamin C", r"Vitamin C.*"],
-        # "Vitamin D2": ["Vitamin D2", r"Vitamin D2.*"],
-        # "Vitamin D3": ["Vitamin D3", r"Vitamin D3.*"],
-        "Vitamin D4": ["Vitamin D4", r"Vitamin D4.*"],
-        "Vitamin E": ["Vitamin E", r"Vitamin E.*"],
-        "Vitamin K1": ["Vitamin K \(phylloquinone\)"],
-        "Vitamin K2": ["Vitamin K \(Menaquinone-4\)"],
-        "Thiamin": ["Thiamin", r"Thiamin.*"],
-        "Riboflavin": ["Riboflavin", r"Riboflavin.*"],
-        "Niacin": ["Niacin", r"Niacin.*"],
-        "Folate": ["Folate, total", r"Folate, total.*"],
-        "Choline": ["Choline", r"Choline.*"],
-        "Phosphorus": ["Phosphorus", r"Phosphorus.*"],
-        "Potassium": ["Potassium", r"Potassium.*"],
-        "Sodium": ["Sodium", r"Sodium.*"],
-        "Iodine": ["Iodine", r"Iodine.*"],
-        "Zinc": ["Zinc", r"Zinc.*"],
-        "Copper": ["Copper", r"Copper.*"],
-        "Selenium": ["Selenium", r"Selenium.*"],
-        "Magnesium": ["Magnesium", r"Magnesium.*"],
-        "Manganese": ["Manganese", r"Manganese.*"],
-        "Chromium": ["Chromium", r"Chromium.*"],
-        "Molybdenum": ["Molybdenum", r"Molybdenum.*"],
-        "Biotin": ["Biotin", r"Biotin.*"],
-        "Iron": ["Iron", r"Iron.*"],
-        "Calcium": ["Calcium", r"Calcium.*"],
-        "Total Fat": [r"(?i)^((?!fatty acids).)*total.*fat.*$"],
-        "Carbohydrate": ["Carbohydrate", r"Carbohydrates.*"],
-        "Protein": ["Protein", r"Protein.*"],
-        "Fiber": [r"(?i).*total.*fiber.*|.*fiber.*total.*"],
-        "Saturated Fat": [
-            r"^(?!.*(?:polyunsat|monounsat)).*Fatty acids,.*(saturated|sat\.).*"
-        ],
-        "Sugars, added": ["Sugars, added", r"Sugars, added.*"],
-        # "Omega 3": [r"(EPA|DHA)"],
-        "Omega 3 (EPA)": ["EPA"],
-        "Omega 3 (DHA)": ["DHA"],
-        "Omega 3 (ALA)": ["ALA"],
-        "Omega 6": [r"(18:2 n-6|18:3 n-6|20:4 n-6)"],
-        # "Omega 6 (LA)": ["18:2 n-6"],
-        # "Omega 6 (GLA)": ["18:3 n-6"],
-        # "Omega 6 (AA)": ["20:4 n-6"],
-        # "Total Sugars": [r"(?i).*total.*sugars.*|.*sugars.*total.*"],
-    }
 
-    # Apply each pattern and update the 'name' column
-    for standard_name, patterns in lookup_table.items():
-        pattern_regex = "|".join(
-            patterns
-        )  # Combine all patterns for this name into one regex
-        nutrient_df.loc[
-            nutrient_df["name"].str.contains(pattern_regex, case=False, regex=True),
-            "name",
-        ] = standard_name
 
-    # Define categories based on the final standardized names
-    macro_categories = [
-        "Total Fat",
-        "Saturated Fat",
-        "Carbohydrate",
-        "Protein",
-        "Fiber",
-        # "Total Sugars",
-        "Sugars, added",
-    ]
-    micro_categories = list(set(lookup_table.keys()) - set(macro_categories))
+def load_nutrient_dataframe(path, cache_dir=FDC_CACHE_DIR, classifier=None):
+    # Load the nutrient data from the cached CSV file
+    nutrient_df = read_fdc_table(path, "nutrient.csv", cache_dir=cache_dir)
+
+    # Standardize the nutrient names in a single pass over the distinct names
+    if classifier is None:
+        classifier = nutrient_name_classifier
+    nutrient_df["name"] = classifier(nutrient_df["name"])
 
-    nutrient_df.loc[nutrient_df["name"].isin(micro_categories), "Category"] = (
+    # Define categories based on the final standardized names
+    nutrient_df.loc[nutrient_df["name"].isin(MICRO_CATEGORIES), "Category"] = (
         "Micronutrient"
     )
-    nutrient_df.loc[nutrient_df["name"].isin(macro_categories), "Category"] = (
+    nutrient_df.loc[nutrient_df["name"].isin(MACRO_CATEGORIES), "Category"] = (
         "Macronutrient"
     )
     nutrient_df.dropna(inplace=True)
@@ -143,59 +120,73 @@ def load_nutrient_dataframe(path):
     return nutrient_df
 
 
-def rotate_nutrient_rows_to_columns(merged_df):
-
-    # def custom_agg(sub_df):
-    #     # Here, sub_df is the DataFrame group passed by apply()
-    #     if (
-    #         sub_df["Nutrient Name"].iloc[0] == "Omega 3"
-    #         or sub_df["Nutrient Name"].iloc[0] == "Omega 6"
-    #     ):
-    #         return sub_df[
-    #             "Nutrient Amount [G]"
-    #         ].sum()  # Sum if the nutrient name is "Omega 3"
-    #     else:
-    #         return sub_df["Nutrient Amount [G]"].mean()
-
-    grouped = (
-        merged_df.groupby(["FDC Name", "Nutrient Category", "Nutrient Name"])
-        .agg({"Nutrient Amount [G]": "mean"})
-        .reset_index()
+def rotate_nutrient_rows_to_columns(food_df, food_nutrient_chunks, nutrient_df):
+    """
+    Pivot the long nutrient rows into one row per food and one column per
+    (Nutrient Category, Nutrient Name).
+
+    Foods and nutrient columns are addressed by integer codes instead of
+    joined strings. The amounts are scatter-added into a preallocated
+    foods x nutrients matrix and averaged per cell, the labels are only
+    attached at the end. The returned table is indexed like food_df and only
+    contains the foods that have at least one nutrient row.
+
+    food_nutrient_chunks is either one DataFrame or an iterable of chunks,
+    every chunk is aggregated into the matrix and can be released right away.
+    """
+    if isinstance(food_nutrient_chunks, pd.DataFrame):
+        food_nutrient_chunks = [food_nutrient_chunks]
+
+    # Nutrient IDs that share a standardized name are averaged into one column
+    nutrient_column_codes, columns = pd.MultiIndex.from_frame(
+        nutrient_df[["Nutrient Category", "Nutrient Name"]]
+    ).factorize()
+    food_index = pd.Index(food_df["fdc_id"])
+    nutrient_index = pd.Index(nutrient_df["Nutrient ID"])
+
+    n_foods, n_columns = len(food_df), len(columns)
+    matrix = np.zeros(n_foods * n_columns, dtype="float64")
+    counts = np.zeros(n_foods * n_columns, dtype="int32")
+    has_food = np.zeros(n_foods, dtype=bool)
+    has_column = np.zeros(n_columns, dtype=bool)
+
+    for food_nutrient_df in food_nutrient_chunks:
+        food_codes = food_index.get_indexer(food_nutrient_df["fdc_id"])
+        nutrient_codes = nutrient_index.get_indexer(food_nutrient_df["Nutrient ID"])
+        is_matched = (food_codes >= 0) & (nutrient_codes >= 0)
+        food_codes = food_codes[is_matched]
+        column_codes = nutrient_column_codes[nutrient_codes[is_matched]]
+        amounts = food_nutrient_df["Nutrient Amount [G]"].to_numpy(dtype="float64")
+        amounts = amounts[is_matched]
+
+        has_food[food_codes] = True
+        has_column[column_codes] = True
+
+        # Scatter-add the amounts and their counts, missing cells stay at 0
+        has_amount = ~np.isnan(amounts)
+        cells = food_codes[has_amount].astype("int64") * n_columns
+        cells += column_codes[has_amount]
+        np.add.at(matrix, cells, amounts[has_amount])
+        np.add.at(counts, cells, 1)
+
+    np.divide(matrix, counts, out=matrix, where=counts > 0)
+    matrix = matrix.reshape(n_foods, n_columns)
+
+    pivot = pd.DataFrame(
+        matrix[has_food][:, has_column],
+        index=food_df.index[has_food],
+        columns=pd.MultiIndex.from_tuples(columns[has_column]),
     )
 
-    # grouped = (
-    #     merged_df.groupby(["FDC Name", "Nutrient Category", "Nutrient Name"])
-    #     .apply(custom_agg)
-    #     .reset_index()
-    # )
-
-    # Now pivot this aggregated data
-    pivot = grouped.pivot(
-        index="FDC Name",
-        columns=["Nutrient Category", "Nutrient Name"],
-        values="Nutrient Amount [G]",
-    ).fillna(0)
-
-    # Finally, reset the index to make 'FDC Name' a column again
-    pivot = pivot.reset_index()
-
     pivot[("Energy", "Energy [KCAL]")] = (
         pivot[("Macronutrient", "Carbohydrate [G]")] * 4
         + pivot[("Macronutrient", "Protein [G]")] * 4
         + pivot[("Macronutrient", "Total Fat [G]")] * 9
     )
-
-    columns = pivot.columns.tolist()
-
-    new_columns = [
-        ("Non Nutrient Data", "FDC Name") if col == ("FDC Name", "") else col
-        for col in columns
-    ]
-    pivot.columns = pd.MultiIndex.from_tuples(new_columns)
     return pivot
 
 
-def merge_dataframes(food_df, food_category_df, food_nutrient_df, nutrient_df):
+def merge_dataframes(food_df, food_category_df, food_nutrient_chunks, nutrient_df):
     # Initial merging
     merged_df = pd.merge(
         food_df,
@@ -204,67 +195,157 @@ def merge_dataframes(food_df, food_category_df, food_nutrient_df, nutrient_df):
         how="inner",
     ).drop(columns=["food_category_id"])
 
-    non_nutrient_df = merged_df.copy()
-    non_nutrient_df.columns = pd.MultiIndex.from_tuples(
-        [("Non Nutrient Data", col) for col in merged_df.columns]
-    )
-
-    # Further merging with food_nutrient_df and nutrient_df
-    merged_df = pd.merge(merged_df, food_nutrient_df, on="fdc_id", how="inner").drop(
-        columns=["fdc_id"]
+    pivot = rotate_nutrient_rows_to_columns(
+        merged_df, food_nutrient_chunks, nutrient_df
     )
 
-    merged_df = pd.merge(merged_df, nutrient_df, on="Nutrient ID", how="inner").drop(
-        columns=["Nutrient ID"]
+    non_nutrient_df = merged_df.drop(columns=["fdc_id"])
+    non_nutrient_df.columns = pd.MultiIndex.from_tuples(
+        [("Non Nutrient Data", col) for col in non_nutrient_df.columns]
     )
 
-    pivot = rotate_nutrient_rows_to_columns(merged_df)
-
-    pivot = non_nutrient_df.merge(pivot).drop(columns=[("Non Nutrient Data", "fdc_id")])
+    pivot = non_nutrient_df.join(pivot, how="inner").reset_index(drop=True)
 
     pivot = pivot.sort_index(axis=1, level=0)
     return pivot
 
 
-def clean_fdc_data(df):
-    df[("Micronutrient", "Omega 3 (EPA + DHA) [G]")] = (
-        df[("Micronutrient", "Omega 3 (EPA) [G]")]
-        + df[("Micronutrient", "Omega 3 (DHA) [G]")]
-    )
-    df.drop(
-        columns=[
-            ("Micronutrient", "Omega 3 (EPA) [G]"),
-            ("Micronutrient", "Omega 3 (DHA) [G]"),
-        ],
-        inplace=True,
-    )
-    df[("Micronutrient", "Vitamin K [UG]")] = (
-        df[("Micronutrient", "Vitamin K1 [UG]")]
-        + df[("Micronutrient", "Vitamin K2 [UG]")]
-    )
-    df.drop(
-        columns=[
-            ("Micronutrient", "Vitamin K1 [UG]"),
-            ("Micronutrient", "Vitamin K2 [UG]"),
-        ],
-        inplace=True,
+def load_fdc_cleaning_rules(path=FDC_CLEANING_RULES_PATH):
+    rules = load_file(path)
+    derived_columns = [
+        (tuple(rule["column"]), [tuple(column) for column in rule["sum_of"]])
+        for rule in rules["derived_columns"]
+    ]
+    rules["derived_columns"] = derived_columns
+    return rules
+
+
+def clean_fdc_data(df, rules=None):
+    """
+    Apply the cleaning rules of config/fdc/clean_fdc_data.yaml.
+
+    All exclusion rules are combined into one row mask, the kept rows and
+    columns are selected in one step and the derived columns are computed on
+    the kept rows only. Source columns of derived columns that a table does
+    not have count as 0.
+    """
+    if rules is None:
+        rules = load_fdc_cleaning_rules()
+
+    exclude = rules["exclude"]
+    is_excluded = (
+        df[("Non Nutrient Data", "Food Category")]
+        .isin(exclude["food_categories"])
+        .to_numpy()
     )
-    df = df[
-        ~df[("Non Nutrient Data", "Food Category")].isin(
-            ["Sweets", "Soups, Sauces, and Gravies", "Beverages", "Baby Foods"]
+    if exclude["name_patterns"]:
+        name_regex = "|".join(f"(?:{pattern})" for pattern in exclude["name_patterns"])
+        is_excluded |= (
+            df[("Non Nutrient Data", "FDC Name")].str.contains(name_regex).to_numpy()
         )
+    is_kept = ~is_excluded
+
+    source_columns = {
+        column for _, sum_of in rules["derived_columns"] for column in sum_of
+    }
+    columns = [
+        column
+        for group in rules["column_groups"]
+        for column in df.columns
+        if column[0] == group and column not in source_columns
     ]
-    df = df[~df[("Non Nutrient Data", "FDC Name")].str.contains("Flour")]
-    df = df[~df[("Non Nutrient Data", "FDC Name")].str.contains("added vitamin")]
-    df = df[["Non Nutrient Data", "Energy", "Macronutrient", "Micronutrient"]]
-    return df
+    cleaned_df = df.loc[is_kept, columns]
 
+    for column, sum_of in rules["derived_columns"]:
+        values = np.zeros(len(cleaned_df))
+        for source_column in sum_of:
+            if source_column in df.columns:
+                values = values + df[source_column].to_numpy()[is_kept]
 
-def query_and_merge_fdc_db(path: str) -> pd.DataFrame:
-    food_df = load_food_dataframe(path)
-    food_category_df = load_food_category_dataframe(path)
-    food_nutrient_df = load_food_nutrient_dataframe(path)
-    nutrient_df = load_nutrient_dataframe(path)
-    df = merge_dataframes(food_df, food_category_df, food_nutrient_df, nutrient_df)
+        # Insert after the last column of the same group
+        group_positions = np.flatnonzero(
+            cleaned_df.columns.get_level_values(0) == column[0]
+        )
+        position = group_positions[-1] + 1 if len(group_positions) else None
+        if position is None:
+            cleaned_df[column] = values
+        else:
+            cleaned_df.insert(int(position), column, values)
+    return cleaned_df
+
+
+def query_and_merge_fdc_shard(
+    path: str,
+    data_type="sr_legacy_food",
+    cache_dir=FDC_CACHE_DIR,
+    chunksize=FDC_CHUNKSIZE,
+) -> pd.DataFrame:
+    food_df = load_food_dataframe(path, cache_dir=cache_dir, data_type=data_type)
+    food_category_df = load_food_category_dataframe(path, cache_dir=cache_dir)
+    nutrient_df = load_nutrient_dataframe(path, cache_dir=cache_dir)
+
+    # Only the nutrient rows of the selected foods are read, chunk by chunk
+    food_nutrient_chunks = iter_food_nutrient_chunks(
+        path, fdc_ids=food_df["fdc_id"], cache_dir=cache_dir, chunksize=chunksize
+    )
+    df = merge_dataframes(food_df, food_category_df, food_nutrient_chunks, nutrient_df)
     df = clean_fdc_data(df)
     return df
+
+
+def concat_fdc_shards(dfs):
+    """
+    Concatenate processed shards with a stable column schema: the columns of
+    the first shard, followed by the columns that only later shards have.
+    Nutrients that a shard does not have are filled with 0.
+    """
+    columns = dfs[0].columns
+    for df in dfs[1:]:
+        columns = columns.append(df.columns.difference(columns, sort=False))
+
+    df = pd.concat(dfs, ignore_index=True)[columns]
+    nutrient_columns = [col for col in columns if col[0] != "Non Nutrient Data"]
+    df[nutrient_columns] = df[nutrient_columns].fillna(0)
+    return df
+
+
+@tracked_stage()
+def query_and_merge_fdc_db(
+    path,
+    cache_dir=FDC_CACHE_DIR,
+    data_types=("sr_legacy_food",),
+    chunksize=FDC_CHUNKSIZE,
+    n_workers=None,
+) -> pd.DataFrame:
+    """
+    Process one or several FDC release folders for one or several data types.
+    Every (release folder, data type) shard runs through load, merge, pivot
+    and cleaning in its own worker process, the results are concatenated in
+    shard order.
+    """
+    paths = [path] if isinstance(path, str) else list(path)
+    data_types = [data_types] if isinstance(data_types, str) else list(data_types)
+    shards = [(path, data_type) for path in paths for data_type in data_types]
+
+    if len(shards) == 1:
+        return query_and_merge_fdc_shard(
+            *shards[0], cache_dir=cache_dir, chunksize=chunksize
+        )
+
+    # Build the caches up front, so that workers never convert the same file
+    if cache_dir is not None:
+        for path in paths:
+            build_fdc_cache(path, cache_dir=cache_dir)
+
+    n_workers = min(n_workers or os.cpu_count(), len(shards))
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        dfs = list(
+            executor.map(
+                partial(
+                    query_and_merge_fdc_shard, cache_dir=cache_dir, chunksize=chunksize
+                ),
+                [path for path, _ in shards],
+                [data_type for _, data_type in shards],
+            )
+        )
+    return concat_fdc_shards(dfs)
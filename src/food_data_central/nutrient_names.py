@@ -0,0 +1,98 @@
+import re
+import pandas as pd
+
+# Lookup table for standardizing names with regex patterns
+NUTRIENT_NAME_LOOKUP_TABLE = {
+    "Vitamin A": ["Vitamin A, RAE", r"Vitamin A, RAE.*"],
+    "Vitamin B-6": ["Vitamin B-6", r"Vitamin B-6.*"],
+    "Vitamin B-12": ["Vitamin B-12", r"Vitamin B-12.*"],
+    "Vitamin C": ["Vitamin C", r"Vitamin C.*"],
+    # "Vitamin D2": ["Vitamin D2", r"Vitamin D2.*"],
+    # "Vitamin D3": ["Vitamin D3", r"Vitamin D3.*"],
+    "Vitamin D4": ["Vitamin D4", r"Vitamin D4.*"],
+    "Vitamin E": ["Vitamin E", r"Vitamin E.*"],
+    "Vitamin K1": [r"Vitamin K \(phylloquinone\)"],
+    "Vitamin K2": [r"Vitamin K \(Menaquinone-4\)"],
+    "Thiamin": ["Thiamin", r"Thiamin.*"],
+    "Riboflavin": ["Riboflavin", r"Riboflavin.*"],
+    "Niacin": ["Niacin", r"Niacin.*"],
+    "Folate": ["Folate, total", r"Folate, total.*"],
+    "Choline": ["Choline", r"Choline.*"],
+    "Phosphorus": ["Phosphorus", r"Phosphorus.*"],
+    "Potassium": ["Potassium", r"Potassium.*"],
+    "Sodium": ["Sodium", r"Sodium.*"],
+    "Iodine": ["Iodine", r"Iodine.*"],
+    "Zinc": ["Zinc", r"Zinc.*"],
+    "Copper": ["Copper", r"Copper.*"],
+    "Selenium": ["Selenium", r"Selenium.*"],
+    "Magnesium": ["Magnesium", r"Magnesium.*"],
+    "Manganese": ["Manganese", r"Manganese.*"],
+    "Chromium": ["Chromium", r"Chromium.*"],
+    "Molybdenum": ["Molybdenum", r"Molybdenum.*"],
+    "Biotin": ["Biotin", r"Biotin.*"],
+    "Iron": ["Iron", r"Iron.*"],
+    "Calcium": ["Calcium", r"Calcium.*"],
+    "Total Fat": [r"(?i)^((?!fatty acids).)*total.*fat.*$"],
+    "Carbohydrate": ["Carbohydrate", r"Carbohydrates.*"],
+    "Protein": ["Protein", r"Protein.*"],
+    "Fiber": [r"(?i).*total.*fiber.*|.*fiber.*total.*"],
+    "Saturated Fat": [
+        r"^(?!.*(?:polyunsat|monounsat)).*Fatty acids,.*(saturated|sat\.).*"
+    ],
+    "Sugars, added": ["Sugars, added", r"Sugars, added.*"],
+    # "Omega 3": [r"(EPA|DHA)"],
+    "Omega 3 (EPA)": ["EPA"],
+    "Omega 3 (DHA)": ["DHA"],
+    "Omega 3 (ALA)": ["ALA"],
+    "Omega 6": [r"(18:2 n-6|18:3 n-6|20:4 n-6)"],
+    # "Omega 6 (LA)": ["18:2 n-6"],
+    # "Omega 6 (GLA)": ["18:3 n-6"],
+    # "Omega 6 (AA)": ["20:4 n-6"],
+    # "Total Sugars": [r"(?i).*total.*sugars.*|.*sugars.*total.*"],
+}
+
+MACRO_CATEGORIES = [
+    "Total Fat",
+    "Saturated Fat",
+    "Carbohydrate",
+    "Protein",
+    "Fiber",
+    # "Total Sugars",
+    "Sugars, added",
+]
+MICRO_CATEGORIES = list(set(NUTRIENT_NAME_LOOKUP_TABLE.keys()) - set(MACRO_CATEGORIES))
+
+
+class NutrientNameClassifier:
+    """
+    Standardizes raw FDC nutrient names with the patterns of a lookup table.
+
+    The patterns of every standard name are compiled once into one regex.
+    A name is matched against the regexes in lookup table order, and every
+    match replaces the current name, so the last matching entry wins.
+    Results are memoized per distinct raw name, which makes one instance
+    cheap to reuse on the nutrient tables of several FDC releases.
+    """
+
+    def __init__(self, lookup_table=NUTRIENT_NAME_LOOKUP_TABLE):
+        self.rules = [
+            (standard_name, re.compile("|".join(patterns), flags=re.IGNORECASE))
+            for standard_name, patterns in lookup_table.items()
+        ]
+        self.memo = {}
+
+    def classify(self, name):
+        if name not in self.memo:
+            standard_name = name
+            for rule_name, regex in self.rules:
+                if regex.search(standard_name):
+                    standard_name = rule_name
+            self.memo[name] = standard_name
+        return self.memo[name]
+
+    def __call__(self, names: pd.Series) -> pd.Series:
+        mapping = {name: self.classify(name) for name in names.dropna().unique()}
+        return names.map(mapping)
+
+
+nutrient_name_classifier = NutrientNameClassifier()
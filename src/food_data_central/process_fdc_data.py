@@ -1,22 +1,87 @@
 import argparse
 import pandas as pd
+from src.food_data_central.cache import FDC_CACHE_DIR, FDC_CHUNKSIZE
 from src.food_data_central.loader import query_and_merge_fdc_db
+from src.food_data_central.incremental import refresh_fdc_data
+from src.food_data_central.hdf_store import write_fdc_data
 
 parser = argparse.ArgumentParser()
 parser.add_argument(
     "--raw_data_path",
+    help="One or several FDC release folders",
     type=str,
-    default="data/raw/FoodData_Central_sr_legacy_food_csv_2018-04",
+    nargs="+",
+    default=["data/raw/FoodData_Central_sr_legacy_food_csv_2018-04"],
     # "data/raw/FoodData_Central_foundation_food_csv_2024-04-18"
 )
 parser.add_argument("--output_path", type=str, default="data/processed/fdc_data.h5")
+parser.add_argument(
+    "--output_format",
+    help="'table' writes a queryable HDF5 table with indexed columns",
+    type=str,
+    choices=["table", "fixed"],
+    default="table",
+)
+parser.add_argument(
+    "--data_types",
+    help="One or several FDC data types",
+    type=str,
+    nargs="+",
+    default=["sr_legacy_food"],
+    # "foundation_food", "branded_food"
+)
+parser.add_argument(
+    "--n_workers",
+    help="Number of worker processes, defaults to the number of cores",
+    type=int,
+    default=None,
+)
+parser.add_argument(
+    "--chunksize",
+    help="Number of food_nutrient rows that are read and aggregated at a time",
+    type=int,
+    default=FDC_CHUNKSIZE,
+)
+parser.add_argument("--cache_dir", type=str, default=FDC_CACHE_DIR)
+parser.add_argument(
+    "--no_cache",
+    help="Parse the raw csv files instead of using the parquet cache",
+    action="store_true",
+    default=False,
+)
+parser.add_argument(
+    "--incremental",
+    help="Only recompute foods that were added or changed since the last run",
+    action="store_true",
+    default=False,
+)
 
 args = parser.parse_args()
 
 
 def main():
-    df = query_and_merge_fdc_db(args.raw_data_path)
-    df.to_hdf(args.output_path, key="nutrition", mode="w")
+    cache_dir = None if args.no_cache else args.cache_dir
+    if args.incremental:
+        if len(args.raw_data_path) > 1 or len(args.data_types) > 1:
+            parser.error("--incremental supports one release folder and data type")
+        refresh_fdc_data(
+            args.raw_data_path[0],
+            args.output_path,
+            cache_dir=cache_dir,
+            data_type=args.data_types[0],
+            chunksize=args.chunksize,
+            output_format=args.output_format,
+        )
+        return
+
+    df = query_and_merge_fdc_db(
+        args.raw_data_path,
+        cache_dir=cache_dir,
+        data_types=args.data_types,
+        chunksize=args.chunksize,
+        n_workers=args.n_workers,
+    )
+    write_fdc_data(df, args.output_path, format=args.output_format)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,284 @@
+import os
+import numpy as np
+import pandas as pd
+
+# Size of the SR Legacy release (April 2018)
+SR_LEGACY_N_FOODS = 7793
+SR_LEGACY_N_FOOD_NUTRIENT_ROWS = 644125
+
+FOOD_CATEGORIES = [
+    "Dairy and Egg Products",
+    "Spices and Herbs",
+    "Baby Foods",
+    "Fats and Oils",
+    "Poultry Products",
+    "Soups, Sauces, and Gravies",
+    "Sausages and Luncheon Meats",
+    "Breakfast Cereals",
+    "Fruits and Fruit Juices",
+    "Pork Products",
+    "Vegetables and Vegetable Products",
+    "Nut and Seed Products",
+    "Beef Products",
+    "Beverages",
+    "Finfish and Shellfish Products",
+    "Legumes and Legume Products",
+    "Lamb, Veal, and Game Products",
+    "Baked Products",
+    "Sweets",
+    "Cereal Grains and Pasta",
+    "Fast Foods",
+    "Meals, Entrees, and Side Dishes",
+    "Snacks",
+    "American Indian/Alaska Native Foods",
+    "Restaurant Foods",
+]
+
+# (name, unit, share of foods that report the nutrient, typical amount)
+NUTRIENTS = [
+    ("Water", "G", 1.0, 60.0),
+    ("Energy", "KCAL", 1.0, 200.0),
+    ("Energy", "kJ", 1.0, 800.0),
+    ("Protein", "G", 1.0, 10.0),
+    ("Total lipid (fat)", "G", 1.0, 10.0),
+    ("Ash", "G", 0.98, 1.5),
+    ("Carbohydrate, by difference", "G", 1.0, 20.0),
+    ("Fiber, total dietary", "G", 0.9, 2.0),
+    ("Sugars, total", "G", 0.8, 5.0),
+    ("Sugars, added", "G", 0.05, 5.0),
+    ("Starch", "G", 0.2, 10.0),
+    ("Calcium, Ca", "MG", 0.98, 50.0),
+    ("Iron, Fe", "MG", 0.98, 2.0),
+    ("Magnesium, Mg", "MG", 0.95, 30.0),
+    ("Phosphorus, P", "MG", 0.96, 150.0),
+    ("Potassium, K", "MG", 0.97, 250.0),
+    ("Sodium, Na", "MG", 0.99, 300.0),
+    ("Zinc, Zn", "MG", 0.95, 1.5),
+    ("Copper, Cu", "MG", 0.9, 0.1),
+    ("Manganese, Mn", "MG", 0.8, 0.3),
+    ("Selenium, Se", "UG", 0.85, 10.0),
+    ("Fluoride, F", "UG", 0.1, 20.0),
+    ("Vitamin C, total ascorbic acid", "MG", 0.9, 10.0),
+    ("Thiamin", "MG", 0.94, 0.1),
+    ("Riboflavin", "MG", 0.94, 0.2),
+    ("Niacin", "MG", 0.94, 3.0),
+    ("Pantothenic acid", "MG", 0.8, 0.5),
+    ("Vitamin B-6", "MG", 0.92, 0.2),
+    ("Folate, total", "UG", 0.9, 30.0),
+    ("Folic acid", "UG", 0.85, 10.0),
+    ("Folate, food", "UG", 0.85, 20.0),
+    ("Folate, DFE", "UG", 0.85, 40.0),
+    ("Choline, total", "MG", 0.6, 30.0),
+    ("Betaine", "MG", 0.4, 5.0),
+    ("Vitamin B-12", "UG", 0.9, 1.0),
+    ("Vitamin B-12, added", "UG", 0.7, 0.1),
+    ("Vitamin A, RAE", "UG", 0.9, 50.0),
+    ("Retinol", "UG", 0.85, 30.0),
+    ("Carotene, beta", "UG", 0.7, 100.0),
+    ("Carotene, alpha", "UG", 0.6, 20.0),
+    ("Cryptoxanthin, beta", "UG", 0.6, 10.0),
+    ("Vitamin A, IU", "IU", 0.92, 300.0),
+    ("Lycopene", "UG", 0.6, 50.0),
+    ("Lutein + zeaxanthin", "UG", 0.6, 100.0),
+    ("Vitamin E (alpha-tocopherol)", "MG", 0.7, 1.0),
+    ("Vitamin E, added", "MG", 0.6, 0.1),
+    ("Vitamin D (D2 + D3), International Units", "IU", 0.7, 20.0),
+    ("Vitamin D (D2 + D3)", "UG", 0.7, 0.5),
+    ("Vitamin D3 (cholecalciferol)", "UG", 0.3, 0.5),
+    ("Vitamin K (phylloquinone)", "UG", 0.7, 10.0),
+    ("Vitamin K (Menaquinone-4)", "UG", 0.1, 5.0),
+    ("Fatty acids, total saturated", "G", 0.95, 3.0),
+    ("Fatty acids, total monounsaturated", "G", 0.93, 3.0),
+    ("Fatty acids, total polyunsaturated", "G", 0.93, 2.0),
+    ("Fatty acids, total trans", "G", 0.3, 0.2),
+    ("Cholesterol", "MG", 0.97, 30.0),
+    ("PUFA 18:2 n-6 c,c", "G", 0.3, 1.0),
+    ("PUFA 18:3 n-6 c,c,c", "G", 0.2, 0.01),
+    ("PUFA 20:4 n-6", "G", 0.2, 0.05),
+    ("PUFA 18:3 n-3 c,c,c (ALA)", "G", 0.3, 0.1),
+    ("PUFA 20:5 n-3 (EPA)", "G", 0.6, 0.05),
+    ("PUFA 22:6 n-3 (DHA)", "G", 0.6, 0.05),
+    ("Tryptophan", "G", 0.5, 0.1),
+    ("Threonine", "G", 0.5, 0.4),
+    ("Isoleucine", "G", 0.5, 0.4),
+    ("Leucine", "G", 0.5, 0.7),
+    ("Lysine", "G", 0.5, 0.6),
+    ("Methionine", "G", 0.5, 0.2),
+    ("Alanine", "G", 0.5, 0.4),
+    ("Glycine", "G", 0.5, 0.4),
+    ("Caffeine", "MG", 0.8, 1.0),
+    ("Theobromine", "MG", 0.8, 1.0),
+    ("Alcohol, ethyl", "G", 0.8, 0.1),
+]
+
+# Fatty acid and sterol entries make up the long tail of the nutrient table
+FATTY_ACIDS = [
+    f"{kind} {carbons}:{bonds}"
+    for kind, bonds in [("SFA", 0), ("MUFA", 1), ("PUFA", 2), ("PUFA", 3)]
+    for carbons in range(4, 25, 2)
+]
+
+FOOD_WORDS = [
+    "Cheese",
+    "Milk",
+    "Yogurt",
+    "Beef",
+    "Chicken",
+    "Pork",
+    "Fish",
+    "Egg",
+    "Apples",
+    "Bananas",
+    "Beans",
+    "Rice",
+    "Bread",
+    "Pasta",
+    "Nuts",
+    "Oil",
+    "Potatoes",
+    "Carrots",
+    "Cereals",
+    "Wheat flour",
+]
+DESCRIPTORS = [
+    "raw",
+    "cooked",
+    "boiled",
+    "roasted",
+    "frozen",
+    "canned",
+    "dried",
+    "whole",
+    "low fat",
+    "skim",
+    "with salt",
+    "without salt",
+    "enriched",
+    "with added vitamin A",
+    "ready-to-eat",
+    "lean only",
+]
+
+
+def generate_nutrient_dataframe(n_extra_nutrients):
+    rows = list(NUTRIENTS)
+    for i in range(n_extra_nutrients):
+        name = FATTY_ACIDS[i % len(FATTY_ACIDS)]
+        if i >= len(FATTY_ACIDS):
+            name = f"{name} isomer {i // len(FATTY_ACIDS)}"
+        rows.append((name, "G", 0.08, 0.05))
+
+    nutrient_df = pd.DataFrame(rows, columns=["name", "unit_name", "share", "amount"])
+    nutrient_df.insert(0, "id", np.arange(1001, 1001 + len(nutrient_df)))
+    nutrient_df["nutrient_nbr"] = np.arange(200, 200 + len(nutrient_df))
+    nutrient_df["rank"] = np.arange(len(nutrient_df)) * 100
+    return nutrient_df
+
+
+def generate_food_dataframe(n_foods, rng, other_data_type_share=0.0):
+    names = (
+        rng.choice(FOOD_WORDS, n_foods).astype(object)
+        + ", "
+        + rng.choice(DESCRIPTORS, n_foods).astype(object)
+        + ", "
+        + rng.choice(DESCRIPTORS, n_foods).astype(object)
+        + " "
+        + np.arange(n_foods).astype(str).astype(object)
+    )
+    # About one percent of the descriptions occur twice
+    duplicates = rng.random(n_foods) < 0.01
+    names[duplicates] = names[np.flatnonzero(duplicates) // 2]
+
+    data_types = np.where(
+        rng.random(n_foods) < other_data_type_share, "branded_food", "sr_legacy_food"
+    )
+    return pd.DataFrame(
+        {
+            "fdc_id": np.arange(167512, 167512 + n_foods),
+            "data_type": data_types,
+            "description": names,
+            "food_category_id": rng.integers(1, len(FOOD_CATEGORIES) + 1, n_foods),
+            "publication_date": "2019-04-01",
+        }
+    )
+
+
+def generate_food_nutrient_chunk(fdc_ids, nutrient_df, rng, first_id):
+    # Every food reports every nutrient with the nutrient's share
+    reported = (
+        rng.random((len(fdc_ids), len(nutrient_df))) < nutrient_df["share"].to_numpy()
+    )
+    food_positions, nutrient_positions = np.nonzero(reported)
+    amounts = rng.gamma(
+        1.0, nutrient_df["amount"].to_numpy()[nutrient_positions]
+    ).round(3)
+    n_rows = len(food_positions)
+    return pd.DataFrame(
+        {
+            "id": np.arange(first_id, first_id + n_rows),
+            "fdc_id": fdc_ids[food_positions],
+            "nutrient_id": nutrient_df["id"].to_numpy()[nutrient_positions],
+            "amount": amounts,
+            "data_points": rng.integers(1, 20, n_rows),
+            "derivation_id": 1,
+            "min": "",
+            "max": "",
+            "median": "",
+            "footnote": "",
+            "min_year_acquired": "",
+        }
+    )
+
+
+def generate_synthetic_fdc_release(
+    path,
+    scale=1.0,
+    seed=0,
+    other_data_type_share=0.0,
+    chunk_n_foods=10_000,
+):
+    """
+    Write a synthetic FDC release with the csv layout of the SR Legacy download
+    (food.csv, food_nutrient.csv, nutrient.csv and food_category.csv) to path.
+
+    scale=1 has about the size of SR Legacy, food_nutrient.csv is written in
+    chunks of foods, so large scales do not need to fit into memory.
+    A share of the foods can be marked as another data type to exercise the
+    data type filter.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(path, exist_ok=True)
+
+    nutrient_df = generate_nutrient_dataframe(n_extra_nutrients=400)
+    nutrient_df[["id", "name", "unit_name", "nutrient_nbr", "rank"]].to_csv(
+        os.path.join(path, "nutrient.csv"), index=False
+    )
+
+    pd.DataFrame(
+        {
+            "id": np.arange(1, len(FOOD_CATEGORIES) + 1),
+            "code": [f"{i:02d}00" for i in range(1, len(FOOD_CATEGORIES) + 1)],
+            "description": FOOD_CATEGORIES,
+        }
+    ).to_csv(os.path.join(path, "food_category.csv"), index=False)
+
+    n_foods = int(SR_LEGACY_N_FOODS * scale)
+    food_df = generate_food_dataframe(n_foods, rng, other_data_type_share)
+    food_df.to_csv(os.path.join(path, "food.csv"), index=False)
+
+    food_nutrient_path = os.path.join(path, "food_nutrient.csv")
+    n_rows = 0
+    fdc_ids = food_df["fdc_id"].to_numpy()
+    for start in range(0, n_foods, chunk_n_foods):
+        chunk = generate_food_nutrient_chunk(
+            fdc_ids[start : start + chunk_n_foods], nutrient_df, rng, n_rows + 1
+        )
+        chunk.to_csv(
+            food_nutrient_path,
+            mode="w" if start == 0 else "a",
+            header=start == 0,
+            index=False,
+        )
+        n_rows += len(chunk)
+
+    return {"n_foods": n_foods, "n_food_nutrient_rows": n_rows}
@@ -6,8 +6,10 @@ from langchain.prompts import ChatPromptTemplate
 from langchain_openai.output_parsers import JsonOutputKeyToolsParser
 
 from src.my_langchain.chain import build_chain_from_config
+from src.my_mlflow.stage_tracking import tracked_stage
 
 
+@tracked_stage()
 def process_df_column_with_llm_in_chunks(
     chain_config, df, input_column, output_column, chunk_size=100
 ):
@@ -0,0 +1,63 @@
+import time
+import subprocess
+import tracemalloc
+
+from src.my_mlflow.stage_tracking import get_n_rows
+
+
+def get_git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_stage(name, func, *func_args, repeat=1, copy_input=False, **func_kwargs):
+    """
+    Run one pipeline stage repeat times and keep the fastest wall time,
+    then once more under tracemalloc for the peak memory, so that the
+    tracing overhead does not end up in the timings.
+
+    Stages that modify their input DataFrame (the first argument) need
+    copy_input=True, so every run gets a fresh copy, which is not timed.
+    """
+
+    def get_args():
+        if copy_input:
+            return (func_args[0].copy(), *func_args[1:])
+        return func_args
+
+    wall_times = []
+    for _ in range(repeat):
+        stage_args = get_args()
+        start = time.perf_counter()
+        result = func(*stage_args, **func_kwargs)
+        wall_times.append(time.perf_counter() - start)
+
+    stage_args = get_args()
+    tracemalloc.start()
+    func(*stage_args, **func_kwargs)
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    wall_time = min(wall_times)
+    rows_in = get_n_rows(func_args[0]) if func_args else None
+    stats = {
+        "wall_time_s": wall_time,
+        "wall_times_s": wall_times,
+        "peak_memory_mb": peak_memory / 2**20,
+        "rows_in": rows_in,
+        "rows_out": len(result),
+        "rows_per_s": None if rows_in is None else rows_in / max(wall_time, 1e-9),
+    }
+    throughput = "" if rows_in is None else f" {stats['rows_per_s']:>12,.0f} rows/s"
+    print(
+        f"  {name:<35} {wall_time:8.3f} s "
+        f"{stats['peak_memory_mb']:9.1f} MB {stats['rows_out']:>10} rows{throughput}"
+    )
+    return result, stats
@@ -0,0 +1,234 @@
+import os
+import sys
+import json
+import time
+import functools
+import threading
+from contextlib import contextmanager
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Stage tracking is opt-in, e.g. STAGE_TRACKING=1 python src/...
+STAGE_TRACKING_ENV = "STAGE_TRACKING"
+STAGE_TRACE_PATH_ENV = "STAGE_TRACE_PATH"
+DEFAULT_STAGE_TRACE_PATH = "outputs/stage_traces/stage_trace.jsonl"
+
+
+def is_stage_tracking_enabled():
+    return os.environ.get(STAGE_TRACKING_ENV, "").lower() in ("1", "true", "yes")
+
+
+def get_rss_mb():
+    """Current resident set size of the process, None if unknown."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss / 2**20
+
+
+def get_max_rss_mb(who="self"):
+    """
+    High-water mark of the process ("self") or of its largest finished child
+    process ("children") over the whole life of the process, None if unknown.
+    """
+    if resource is None:
+        return None
+    usage = resource.getrusage(
+        resource.RUSAGE_SELF if who == "self" else resource.RUSAGE_CHILDREN
+    )
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return (
+        usage.ru_maxrss / 2**20 if sys.platform == "darwin" else usage.ru_maxrss / 2**10
+    )
+
+
+class RssSampler:
+    """
+    Peak RSS of the process while a stage runs, sampled by a thread every
+    interval seconds.
+
+    Peaks between two samples are caught through ru_maxrss: if the process
+    high-water mark rose during the stage, it was set by the stage. Child
+    processes, e.g. the process pool workers of the FDC shards and the
+    parallel REWE cleaning, are measured with RUSAGE_CHILDREN once they
+    have finished.
+    """
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+
+    def sample(self):
+        while not self.stopped.wait(self.interval):
+            rss = get_rss_mb()
+            if rss is not None:
+                self.peak_rss = max(self.peak_rss or 0, rss)
+
+    def start(self):
+        self.start_rss = get_rss_mb()
+        self.peak_rss = self.start_rss
+        self.start_max_rss = get_max_rss_mb("self")
+        self.start_children_max_rss = get_max_rss_mb("children")
+        self.thread.start()
+
+    def stop(self, record):
+        self.stopped.set()
+        self.thread.join()
+        peak_rss = self.peak_rss
+        end_rss = get_rss_mb()
+        if end_rss is not None:
+            peak_rss = max(peak_rss or 0, end_rss)
+        max_rss = get_max_rss_mb("self")
+        if max_rss is not None and max_rss > (self.start_max_rss or 0):
+            peak_rss = max(peak_rss or 0, max_rss)
+
+        record.peak_rss_mb = peak_rss
+        if peak_rss is not None and self.start_rss is not None:
+            record.rss_increase_mb = peak_rss - self.start_rss
+        children_max_rss = get_max_rss_mb("children")
+        if children_max_rss and children_max_rss > (self.start_children_max_rss or 0):
+            record.children_peak_rss_mb = children_max_rss
+
+
+class StageRecord:
+    def __init__(self, name, rows_in=None, rows_out=None):
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = rows_out
+        self.wall_time_s = None
+        self.peak_rss_mb = None
+        self.rss_increase_mb = None
+        self.children_peak_rss_mb = None
+
+    @property
+    def rows_per_s(self):
+        rows = self.rows_in if self.rows_in is not None else self.rows_out
+        if rows is None or not self.wall_time_s:
+            return None
+        return rows / self.wall_time_s
+
+    def to_dict(self):
+        return {
+            "stage": self.name,
+            "wall_time_s": self.wall_time_s,
+            "rows_in": self.rows_in,
+            "rows_out": self.rows_out,
+            "rows_per_s": self.rows_per_s,
+            "peak_rss_mb": self.peak_rss_mb,
+            "rss_increase_mb": self.rss_increase_mb,
+            "children_peak_rss_mb": self.children_peak_rss_mb,
+        }
+
+
+def write_stage_trace(record):
+    trace_path = os.environ.get(STAGE_TRACE_PATH_ENV, DEFAULT_STAGE_TRACE_PATH)
+    os.makedirs(os.path.dirname(trace_path) or ".", exist_ok=True)
+    entry = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "pid": os.getpid(),
+        **record.to_dict(),
+    }
+    with open(trace_path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry) + "\n")
+
+
+def log_stage_metrics(record):
+    """
+    Log the stage as MLflow metrics prefixed with the stage name. Without an
+    active run, MLflow starts one in the current experiment, which can be set
+    with init_mlflow or the MLFLOW_EXPERIMENT_NAME environment variable.
+    """
+    try:
+        import mlflow
+    except ImportError:
+        return
+
+    metrics = {
+        f"{record.name}.{key}": value
+        for key, value in record.to_dict().items()
+        if key != "stage" and value is not None
+    }
+    mlflow.log_metrics(metrics)
+
+
+@contextmanager
+def track_stage(name, rows_in=None):
+    """
+    Record wall time, rows in and out, throughput and peak RSS of a block.
+    peak_rss_mb is the peak RSS of the process during the block and
+    rss_increase_mb its increase over the RSS at the start of the block.
+    children_peak_rss_mb is the peak RSS of the largest child process that
+    finished in the block, None if none exceeded the earlier child processes.
+    Set record.rows_out inside the block. Does nothing unless stage tracking
+    is enabled with the STAGE_TRACKING environment variable.
+
+    with track_stage("scrape_rewe_online_shop") as record:
+        ...
+        record.rows_out = len(df)
+    """
+    record = StageRecord(name, rows_in=rows_in)
+    if not is_stage_tracking_enabled():
+        yield record
+        return
+
+    sampler = RssSampler()
+    sampler.start()
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record.wall_time_s = time.perf_counter() - start
+        sampler.stop(record)
+
+    write_stage_trace(record)
+    log_stage_metrics(record)
+
+
+def get_n_rows(obj):
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        return len(obj)
+    return None
+
+
+def tracked_stage(name=None):
+    """
+    Decorator version of track_stage. Rows in are the rows of the first
+    DataFrame argument, rows out the rows of the returned DataFrame.
+    """
+
+    def decorator(func):
+        stage_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not is_stage_tracking_enabled():
+                return func(*args, **kwargs)
+
+            rows_in = next(
+                (
+                    get_n_rows(arg)
+                    for arg in list(args) + list(kwargs.values())
+                    if get_n_rows(arg) is not None
+                ),
+                None,
+            )
+            with track_stage(stage_name, rows_in=rows_in) as record:
+                result = func(*args, **kwargs)
+                record.rows_out = get_n_rows(result)
+            return result
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,223 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import pandas as pd
+
+from src.my_mlflow.benchmarking import get_git_commit, run_stage
+from src.rewe_data.cleaning import (
+    REWE_TEXT_DTYPES,
+    RAW_COLUMNS_TO_DROP,
+    drop_unnecessary_data,
+    remove_patterns,
+    process_price_and_grammage,
+    handle_stueck_entries,
+    compact_dtypes,
+    load_weights_per_stueck_list,
+    clean_rewe_dataset,
+    clean_rewe_dataset_in_chunks,
+)
+from src.rewe_data.synthetic_products import (
+    generate_synthetic_rewe_scrape,
+    generate_weights_per_stueck_list,
+)
+
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--n_rows",
+    help="Sizes of the synthetic raw scrapes in rows",
+    type=int,
+    nargs="+",
+    default=[10_000, 100_000, 1_000_000],
+)
+parser.add_argument(
+    "--work_dir",
+    help="Folder for the synthetic scrapes and the weights list",
+    type=str,
+    default="data/benchmark/rewe",
+)
+parser.add_argument(
+    "--reference_dir",
+    help="Folder with the frozen reference outputs of the cleaning",
+    type=str,
+    default="data/benchmark/rewe/reference",
+)
+parser.add_argument(
+    "--freeze_reference",
+    help="Save the current cleaning output as the new reference",
+    action="store_true",
+    default=False,
+)
+parser.add_argument("--output_dir", type=str, default="outputs/benchmarks")
+parser.add_argument("--repeat", help="Timed runs per step", type=int, default=3)
+parser.add_argument("--chunksize", type=int, default=100_000)
+parser.add_argument("--seed", type=int, default=0)
+
+args = parser.parse_args()
+
+
+def drop_raw_columns(df):
+    return df.drop(columns=RAW_COLUMNS_TO_DROP)
+
+
+def benchmark_scrape(raw_data_path, weights_list_path, output_path, repeat):
+    weights_per_stueck_list = load_weights_per_stueck_list(weights_list_path)
+    raw_df = pd.read_csv(raw_data_path, dtype=REWE_TEXT_DTYPES)
+
+    steps = {}
+    df, steps["drop_unnecessary_data"] = run_stage(
+        "drop_unnecessary_data",
+        drop_unnecessary_data,
+        raw_df,
+        repeat=repeat,
+        copy_input=True,
+    )
+    df, steps["remove_patterns"] = run_stage(
+        "remove_patterns", remove_patterns, df, repeat=repeat, copy_input=True
+    )
+    df, steps["process_price_and_grammage"] = run_stage(
+        "process_price_and_grammage",
+        process_price_and_grammage,
+        df,
+        repeat=repeat,
+        copy_input=True,
+    )
+    df, steps["handle_stueck_entries"] = run_stage(
+        "handle_stueck_entries",
+        handle_stueck_entries,
+        df,
+        weights_per_stueck_list,
+        repeat=repeat,
+        copy_input=True,
+    )
+    df, steps["compact_dtypes"] = run_stage(
+        "compact_dtypes",
+        compact_dtypes,
+        drop_raw_columns(df),
+        repeat=repeat,
+        copy_input=True,
+    )
+    cleaned_df, steps["clean_rewe_dataset"] = run_stage(
+        "clean_rewe_dataset",
+        clean_rewe_dataset,
+        raw_df,
+        weights_list_path,
+        repeat=repeat,
+        copy_input=True,
+    )
+
+    start = time.perf_counter()
+    clean_rewe_dataset_in_chunks(
+        raw_data_path, output_path, weights_list_path, chunksize=args.chunksize
+    )
+    steps["clean_rewe_dataset_in_chunks"] = {"wall_time_s": time.perf_counter() - start}
+    chunked_df = pd.read_parquet(output_path)
+    return steps, cleaned_df, chunked_df
+
+
+def compare_with_reference(df, reference_df):
+    """
+    Compare the cleaned dataset column by column with the frozen reference.
+    Returns a list of the differences, empty if both are equal.
+    """
+    df = df.reset_index(drop=True)
+    reference_df = reference_df.reset_index(drop=True)
+
+    differences = []
+    if list(df.columns) != list(reference_df.columns):
+        differences.append(
+            f"columns {list(df.columns)} != reference {list(reference_df.columns)}"
+        )
+    if len(df) != len(reference_df):
+        differences.append(f"{len(df)} rows != reference {len(reference_df)} rows")
+        return differences
+
+    for column in reference_df.columns.intersection(df.columns):
+        try:
+            pd.testing.assert_series_equal(df[column], reference_df[column])
+        except AssertionError as e:
+            differences.append(f"{column}: {e}")
+    return differences
+
+
+def main():
+    os.makedirs(args.work_dir, exist_ok=True)
+    os.makedirs(args.output_dir, exist_ok=True)
+    weights_list_path = os.path.join(args.work_dir, "weights_per_stueck_list.json")
+    with open(weights_list_path, "w", encoding="utf-8") as f:
+        json.dump(generate_weights_per_stueck_list(), f, ensure_ascii=False)
+
+    results = {
+        "commit": get_git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "repeat": args.repeat,
+        "scrapes": [],
+    }
+    all_equal = True
+
+    for n_rows in args.n_rows:
+        raw_data_path = os.path.join(args.work_dir, f"synthetic_rewe_{n_rows}.csv")
+        if not os.path.isfile(raw_data_path):
+            print(f"Generating synthetic scrape at {raw_data_path}")
+            # Written like scrape_rewe_online_shop.py, with the index column
+            generate_synthetic_rewe_scrape(n_rows, seed=args.seed).to_csv(raw_data_path)
+
+        print(f"Cleaning {n_rows} rows")
+        output_path = os.path.join(args.work_dir, f"cleaned_rewe_{n_rows}.parquet")
+        steps, cleaned_df, chunked_df = benchmark_scrape(
+            raw_data_path, weights_list_path, output_path, args.repeat
+        )
+
+        reference_path = os.path.join(
+            args.reference_dir, f"cleaned_rewe_{n_rows}.parquet"
+        )
+        if args.freeze_reference:
+            os.makedirs(args.reference_dir, exist_ok=True)
+            cleaned_df.to_parquet(reference_path, index=False)
+            print(f"  Froze reference output at {reference_path}")
+
+        differences = None
+        if os.path.isfile(reference_path):
+            reference_df = pd.read_parquet(reference_path)
+            differences = compare_with_reference(cleaned_df, reference_df)
+            differences += [
+                f"chunked {difference}"
+                for difference in compare_with_reference(chunked_df, reference_df)
+            ]
+            for difference in differences:
+                print(f"  MISMATCH {difference}")
+            all_equal = all_equal and not differences
+            print(f"  Equal to reference: {not differences}")
+        else:
+            print(f"  No reference at {reference_path}, run with --freeze_reference")
+
+        results["scrapes"].append(
+            {
+                "n_rows": n_rows,
+                "rows_out": len(cleaned_df),
+                "equal_to_reference": (
+                    None if differences is None else not differences
+                ),
+                "differences": differences,
+                "steps": steps,
+            }
+        )
+
+    output_path = os.path.join(
+        args.output_dir,
+        f"rewe_cleaning_{time.strftime('%Y%m%d_%H%M%S')}_{results['commit']}.json",
+    )
+    with open(output_path, "w") as f:
+        json.dump(results, f, indent=4)
+    print(f"Saved benchmark results to {output_path}")
+
+    if not all_equal:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
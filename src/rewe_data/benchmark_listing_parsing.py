@@ -0,0 +1,130 @@
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import platform
+
+from src.rewe_data.scraping import (
+    parse_listing_page,
+    get_number_of_pages_from_page_source,
+)
+from src.rewe_data.synthetic_products import write_synthetic_listing_pages
+
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--html_dir",
+    help="Saved listing pages, e.g. the --record_dir of the http scraper",
+    type=str,
+    default="data/fixtures/rewe",
+)
+parser.add_argument(
+    "--n_rows",
+    help="Products of the synthetic listing pages written if html_dir is empty",
+    type=int,
+    default=10_000,
+)
+parser.add_argument(
+    "--parsers", type=str, nargs="+", default=["bs4", "lxml"], choices=["bs4", "lxml"]
+)
+parser.add_argument("--output_dir", type=str, default="outputs/benchmarks")
+parser.add_argument("--repeat", help="Timed runs per parser", type=int, default=3)
+parser.add_argument("--seed", type=int, default=0)
+
+args = parser.parse_args()
+
+
+def parse_pages(page_sources, parser_name):
+    pages = []
+    for page_source in page_sources:
+        pages.append(
+            (
+                parse_listing_page(
+                    page_source, None, parser=parser_name, with_detail_href=True
+                ),
+                get_number_of_pages_from_page_source(page_source, parser=parser_name),
+            )
+        )
+    return pages
+
+
+def main():
+    paths = sorted(
+        glob.glob(os.path.join(args.html_dir, "**", "*.html"), recursive=True)
+    )
+    if not paths:
+        print(f"No saved pages in {args.html_dir}, writing synthetic listing pages")
+        write_synthetic_listing_pages(args.html_dir, args.n_rows, seed=args.seed)
+        paths = sorted(
+            glob.glob(os.path.join(args.html_dir, "**", "*.html"), recursive=True)
+        )
+
+    page_sources = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            page_sources.append(f.read())
+    n_mb = sum(len(page_source) for page_source in page_sources) / 2**20
+    print(f"{len(page_sources)} pages, {n_mb:.1f} MB")
+
+    results = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "html_dir": args.html_dir,
+        "n_pages": len(page_sources),
+        "parsers": {},
+    }
+    outputs = {}
+    for parser_name in args.parsers:
+        wall_times = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            outputs[parser_name] = parse_pages(page_sources, parser_name)
+            wall_times.append(time.perf_counter() - start)
+
+        n_products = sum(len(products) for products, _ in outputs[parser_name])
+        wall_time = min(wall_times)
+        results["parsers"][parser_name] = {
+            "wall_time_s": wall_time,
+            "wall_times_s": wall_times,
+            "n_products": n_products,
+            "pages_per_s": len(page_sources) / wall_time,
+            "products_per_s": n_products / wall_time,
+        }
+        print(
+            f"  {parser_name:<6} {wall_time:8.3f} s "
+            f"{len(page_sources) / wall_time:10,.0f} pages/s "
+            f"{n_products / wall_time:12,.0f} products/s"
+        )
+
+    # Every parser has to return exactly the same product dicts
+    reference_name = args.parsers[0]
+    mismatches = [
+        os.path.relpath(path, args.html_dir)
+        for parser_name in args.parsers[1:]
+        for path, page, reference_page in zip(
+            paths, outputs[parser_name], outputs[reference_name]
+        )
+        if page != reference_page
+    ]
+    results["equal_outputs"] = not mismatches
+    results["mismatched_pages"] = mismatches
+    for path in mismatches[:10]:
+        print(f"  MISMATCH {path}")
+    print(f"  Equal outputs: {not mismatches}")
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    output_path = os.path.join(
+        args.output_dir,
+        f"listing_parsing_{time.strftime('%Y%m%d_%H%M%S')}.json",
+    )
+    with open(output_path, "w") as f:
+        json.dump(results, f, indent=4)
+    print(f"Saved benchmark results to {output_path}")
+
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
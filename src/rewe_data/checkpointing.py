@@ -0,0 +1,134 @@
+import os
+import json
+import glob
+import pandas as pd
+
+
+def get_checkpoint_dir(output_path):
+    return f"{os.path.splitext(output_path)[0]}_parts"
+
+
+def write_atomically(path, write):
+    # A crash while writing never leaves a half-written file behind
+    tmp_path = f"{path}.tmp"
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+class ScrapeCheckpoint:
+    """
+    Crash-safe progress of a scraping run. Every scraped page is written to
+    its own parquet part file, and checkpoint.json records the categories in
+    visiting order, the finished ones and the last finished page of the
+    current category. Both are replaced atomically, so after a crash,
+    captcha or browser disconnect a restarted run can skip everything that
+    is already on disk.
+
+    The checkpoint only ever deletes its own files (part files,
+    checkpoint.json and their .tmp files), so checkpoint_dir can be any
+    folder, e.g. the folder of the raw data.
+    """
+
+    def __init__(self, checkpoint_dir, resume=False):
+        self.checkpoint_dir = checkpoint_dir
+        self.checkpoint_path = os.path.join(checkpoint_dir, "checkpoint.json")
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        if not resume:
+            self.remove_files()
+
+        self.state = {"categories": [], "finished_categories": [], "last_page": 0}
+        if os.path.isfile(self.checkpoint_path):
+            with open(self.checkpoint_path, encoding="utf-8") as f:
+                self.state = json.load(f)
+
+    @property
+    def finished_categories(self):
+        return list(self.state["finished_categories"])
+
+    def get_n_finished_pages(self, category):
+        """Pages of the category that are already on disk."""
+        if self.state["categories"] and self.state["categories"][-1] == category:
+            return self.state["last_page"]
+        return 0
+
+    def start_category(self, category):
+        if category not in self.state["categories"]:
+            self.state["categories"].append(category)
+            self.state["last_page"] = 0
+            self.save()
+
+    def get_part_path(self, category, page):
+        category_index = self.state["categories"].index(category)
+        return os.path.join(
+            self.checkpoint_dir, f"part_{category_index:04d}_{page:05d}.parquet"
+        )
+
+    def write_page(self, df, category, page):
+        write_atomically(
+            self.get_part_path(category, page),
+            lambda path: df.to_parquet(path, index=False),
+        )
+        self.state["last_page"] = page
+        self.save()
+
+    def finish_category(self, category):
+        self.state["finished_categories"].append(category)
+        self.state["last_page"] = 0
+        self.save()
+
+    def save(self):
+        def write(path):
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(self.state, f, ensure_ascii=False, indent=4)
+
+        write_atomically(self.checkpoint_path, write)
+
+    def assemble(self, output_path):
+        """
+        Write all parts in category and page order to one csv, like the
+        concatenated page DataFrames, reading one part at a time.
+        Returns the number of rows.
+        """
+        n_rows = 0
+        columns = None
+        part_paths = sorted(
+            glob.glob(os.path.join(self.checkpoint_dir, "part_*.parquet"))
+        )
+        for part_path in part_paths:
+            df = pd.read_parquet(part_path)
+            if len(df.columns) == 0:
+                continue
+            if columns is None:
+                columns = list(df.columns)
+            df = df.reindex(columns=columns)
+            df.index += n_rows
+            df.to_csv(output_path, mode="a" if n_rows else "w", header=not n_rows)
+            n_rows += len(df)
+
+        if columns is None:
+            pd.DataFrame().to_csv(output_path)
+        return n_rows
+
+    def get_own_paths(self):
+        return [
+            path
+            for pattern in [
+                "part_*.parquet",
+                "part_*.parquet.tmp",
+                "checkpoint.json",
+                "checkpoint.json.tmp",
+            ]
+            for path in glob.glob(os.path.join(self.checkpoint_dir, pattern))
+        ]
+
+    def remove_files(self):
+        for path in self.get_own_paths():
+            os.remove(path)
+
+    def remove(self):
+        """Remove the checkpoint files, and the folder if it is then empty."""
+        self.remove_files()
+        try:
+            os.rmdir(self.checkpoint_dir)
+        except OSError:
+            pass
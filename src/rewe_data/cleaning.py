@@ -1,62 +1,134 @@
 import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
 import re
 import json
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
 
+from src.config.loader import load_file
+from src.my_mlflow.stage_tracking import tracked_stage
+from src.rewe_data.name_cache import (
+    NAME_CACHE_COLUMNS,
+    ReweNameCache,
+    get_name_cache_version,
+)
 
-def parse_price_per_unit(row):
-    if pd.notna(row["Amount"]) and pd.notna(row["Price"]):
-        price = float(row["Price"].replace("€", "").replace(",", ".").strip())
-        amount = float(
-            row["Amount"]
-        )  # This should already be adjusted to per 100g units
-        if amount > 0:
-            price_per_unit = price / amount
-            return round(price_per_unit, 2)
-    return None
-
-
-def extract_unit_and_amount_from_name(name):
-    match = re.search(r"(\d+,\d+|\d+)\s*(kg|g|ml|l)", name)
-    if match:
-        amount = match.group(1).replace(",", ".")
-        unit = match.group(2)
-        if unit == "kg":
-            unit = "100g"
-            amount = float(amount) * 10  # Convert kg to units of 100g
-        elif unit == "g":
-            unit = "100g"
-            amount = float(amount) / 100  # Normalize grams to units of 100g
-        elif unit == "l":
-            unit = "100g"
-            amount = (
-                float(amount) * 1000 / 100
-            )  # Convert liters to grams and then to units of 100g
-        elif unit == "ml":
-            unit = "100g"
-            amount = float(amount) / 100  # Normalize milliliters to units of 100g
-        return unit, amount
-    return None, None
-
-
-def remove_patterns(df):
-    patterns_to_remove = [
-        r"ja!\s*",
-        r"\bca\.\s*",
-        r"\bBio\b",
-        r"\bREWE\b",
-        r"\bBeste Wahl\b",
-        r"\bUNSER LAND\b",
-        r"\baus der Region\b",
-        r"\bim Netz\b",
-        r"\bim Beutel\b",
-        r"\bim Kochbeutel\b",
-        r"\bim Topf\b",
-        r"\bim Glas\b",
-    ]
-    for pattern in patterns_to_remove:
-        df["Name"] = df["Name"].apply(
-            lambda x: re.sub(pattern, "", x, flags=re.IGNORECASE).strip()
-        )
+REWE_CLEANING_RULES_PATH = "config/rewe/clean_rewe_dataset.yaml"
+REWE_CHUNKSIZE = 100_000
+
+# Text columns are read as strings, even if they are empty in a chunk
+REWE_TEXT_DTYPES = {"Name": str, "Price": str, "Grammage": str, "Category": str}
+
+UNIT_DTYPE = pd.CategoricalDtype(["100g", "Stück"])
+
+UNIT_AND_AMOUNT_PATTERN = r"(\d+,\d+|\d+)\s*(kg|g|ml|l)"
+STUECK_PATTERN = r"(\d+)\s*Stück"
+STUECK_NAME_PATTERN = r"\d+\s*Stück"
+
+
+def parse_euro_prices(prices):
+    # "1,99 €" -> 1.99
+    return (
+        prices.str.replace("€", "", regex=False)
+        .str.replace(",", ".", regex=False)
+        .str.strip()
+        .astype(float)
+    )
+
+
+def parse_euro_cents(prices):
+    # "1,99 €" -> 199
+    return np.rint(parse_euro_prices(prices) * 100).astype("Int32")
+
+
+def get_euro_prices(df):
+    # Euro prices from the integer cents, 199 / 100 gives the same float as "1,99"
+    return df["Price (ct)"].to_numpy(dtype="float64", na_value=np.nan) / 100
+
+
+def round_to_cents(values):
+    """
+    np.round(x, 2) computes rint(x * 100) / 100, which can differ from
+    Python's round(x, 2) when x * 100 lies right next to a .5 boundary.
+    These few values are rounded with Python's round.
+    """
+    values = np.asarray(values, dtype="float64")
+    scaled = values * 100
+    rounded = np.rint(scaled) / 100
+    is_tie = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    rounded[is_tie] = [round(value, 2) for value in values[is_tie].tolist()]
+    return rounded
+
+
+def extract_units_and_amounts(texts):
+    """
+    Extract the first amount with a unit (kg, g, ml, l) from every text and
+    convert it into units of 100g. Texts without an amount get None and NaN.
+    """
+    match = texts.str.extract(UNIT_AND_AMOUNT_PATTERN)
+    unit = match[1].to_numpy()
+    amount = match[0].str.replace(",", ".", regex=False).astype(float).to_numpy()
+
+    amount = np.where(unit == "kg", amount * 10, amount)
+    amount = np.where((unit == "g") | (unit == "ml"), amount / 100, amount)
+    # Convert liters to grams and then to units of 100g
+    amount = np.where(unit == "l", amount * 1000 / 100, amount)
+
+    units = pd.Series(np.where(pd.isna(unit), None, "100g"), index=texts.index)
+    amounts = pd.Series(amount, index=texts.index)
+    return units, amounts
+
+
+def load_rewe_cleaning_rules(path=REWE_CLEANING_RULES_PATH):
+    rules = load_file(path)
+    # An empty name_patterns key is read as None
+    rules["name_patterns"] = rules.get("name_patterns") or []
+    return rules
+
+
+# Names that the name patterns are checked on for empty matches
+NAME_PATTERN_PROBE = "ja! REWE Bio Äpfel-Mus (ca. 1,5 kg) im Glas,lose 10 Stück"
+
+
+def compile_name_patterns(patterns):
+    """
+    Compile the patterns into one regex that also matches the whitespace
+    around them and any other run of whitespace, to be replaced with
+    replace_name_pattern. This strips all patterns and collapses whitespace
+    in one pass. Patterns that can match the empty string, including
+    zero-width patterns like lookaheads or \\b, are rejected, as they would
+    match between characters.
+    """
+    patterns = list(patterns or [])
+    if not patterns:
+        return re.compile(r"\s+")
+    for pattern in patterns:
+        regex = re.compile(pattern, flags=re.IGNORECASE)
+        if regex.fullmatch("") or any(
+            match.start() == match.end() for match in regex.finditer(NAME_PATTERN_PROBE)
+        ):
+            raise ValueError(f"Name pattern matches the empty string: {pattern!r}")
+
+    alternation = "|".join(f"(?:{pattern})" for pattern in patterns)
+    return re.compile(rf"(?:\s*(?:{alternation}))+\s*|\s+", flags=re.IGNORECASE)
+
+
+def replace_name_pattern(match):
+    # Patterns between two non-space characters, e.g. in "Milch-Bio-Joghurt",
+    # are removed without leaving a space behind
+    return " " if any(char.isspace() for char in match.group()) else ""
+
+
+def remove_patterns(df, name_patterns=None):
+    if name_patterns is None:
+        name_patterns = load_rewe_cleaning_rules()["name_patterns"]
+
+    regex = compile_name_patterns(name_patterns)
+    df["Name"] = (
+        df["Name"].str.replace(regex, replace_name_pattern, regex=True).str.strip()
+    )
     return df
 
 
@@ -83,101 +155,373 @@ def drop_unnecessary_data(df):
     df = df[~df["Category"].isin(categories_to_remove)]
     df.reset_index(drop=True, inplace=True)
     df = df.drop_duplicates(subset=["Original Name"], keep="first")
+
+    # Parse the price strings once, all later steps use the integer cents
+    df["Price (ct)"] = parse_euro_cents(df["Price"])
     return df
 
 
 def handle_stueck_entries(df, weights_per_stueck_list):
-    # Function to remove 'Stück' and associated number from the name
-    def clean_name(name):
-        return re.sub(r"\d+\s*Stück", "", name).strip()
-
-    # Function to extract 'Stück' and its associated number from Grammage or Name
-    def extract_stueck_and_number(text):
-        match = re.search(r"(\d+)\s*Stück", text)
-        if match:
-            return "Stück", match.group(1)
-        return None, None
-
-    # Processing each row for missing unit or amount
-    for index, row in df.iterrows():
-        if row["Unit"] is None or row["Amount"] is None:
-            unit, amount = extract_stueck_and_number(row["Name"])
-            if unit is None or amount is None:
-                unit, amount = extract_stueck_and_number(row["Grammage"])
-            df.at[index, "Unit"] = unit if unit is not None else df.at[index, "Unit"]
-            df.at[index, "Amount"] = (
-                amount if amount is not None else df.at[index, "Amount"]
-            )
-            if unit == "Stück" and amount is not None:
-                df.at[index, "Price per Unit"] = round(
-                    float(row["Price"].replace("€", "").replace(",", ".").strip())
-                    / float(amount),
-                    2,
-                )
-        # Clean up the name regardless
-        df.at[index, "Name"] = clean_name(row["Name"])
+    # Rows without a unit get the 'Stück' count from the Name or the Grammage
+    is_missing = df["Unit"].isnull()
+    count = df.loc[is_missing, "Name"].str.extract(STUECK_PATTERN)[0]
+    count = count.fillna(df.loc[is_missing, "Grammage"].str.extract(STUECK_PATTERN)[0])
+    count = count[count.notna()]
+
+    if len(count) > 0:
+        df.loc[count.index, "Unit"] = "Stück"
+        # The count is kept as it appears in the text, like before
+        df["Amount"] = df["Amount"].astype(object)
+        df.loc[count.index, "Amount"] = count
+
+        n_pieces = count.astype(float)
+        n_pieces = n_pieces[n_pieces > 0]
+        price = pd.Series(get_euro_prices(df), index=df.index)
+        df.loc[n_pieces.index, "Price per Unit"] = round_to_cents(
+            price[n_pieces.index] / n_pieces
+        )
 
+    # Remove 'Stück' and associated number from the name
+    df["Name"] = df["Name"].str.replace(STUECK_NAME_PATTERN, "", regex=True).str.strip()
+
+    # Look up the weight of every distinct name, default to 100g if not found
     weights_dict = {
         item["Name"]: item["Weight (g)"] for item in weights_per_stueck_list
     }
+    name_codes, names = pd.factorize(df["Name"])
+    weights = np.array([weights_dict.get(name, 100) for name in names])
+    df["Weight per Unit (g)"] = weights[name_codes]
 
-    df["Weight per Unit (g)"] = df["Name"].apply(
-        lambda x: weights_dict.get(x, 100)
-    )  # default to 100g if not found
-    df["Price per 100g"] = df.apply(
-        lambda row: (
-            row["Price per Unit"]
-            if row["Unit"] == "100g"
-            else (row["Price per Unit"] / row["Weight per Unit (g)"]) * 100
-        ),
-        axis=1,
+    df["Price per 100g"] = np.where(
+        df["Unit"] == "100g",
+        df["Price per Unit"],
+        (df["Price per Unit"] / df["Weight per Unit (g)"]) * 100,
     )
     return df
 
 
 def process_price_and_grammage(df):
-
-    # Apply extraction function to the 'Name' column
-    unit, amount = zip(*df["Name"].apply(extract_unit_and_amount_from_name))
-
+    # Extract unit and amount from the 'Name' column
+    unit, amount = extract_units_and_amounts(df["Name"])
     df.loc[:, "Unit"] = unit
     df.loc[:, "Amount"] = amount
+
     # Clean up the 'Name' column
-    name = df["Name"].apply(
-        lambda x: re.sub(r"\d+,\d+\s*(kg|g|ml|l)|\d+\s*(kg|g|ml|l)", "", x).strip()
+    df.loc[:, "Name"] = (
+        df["Name"]
+        .str.replace(r"\d+,\d+\s*(kg|g|ml|l)|\d+\s*(kg|g|ml|l)", "", regex=True)
+        .str.strip()
     )
-    df.loc[:, "Name"] = name
 
-    # If units or amounts are missing, attempt to extract from 'Grammage'
-    for index, row in df[df["Unit"].isnull() | df["Amount"].isnull()].iterrows():
-        if any(x in row["Grammage"] for x in ["kg", "g", "ml", "l"]):
-            unit, amount = extract_unit_and_amount_from_name(row["Grammage"])
-            df.at[index, "Unit"] = unit or df.at[index, "Unit"]
-            df.at[index, "Amount"] = amount or df.at[index, "Amount"]
+    # If units or amounts are missing, attempt to extract from 'Grammage'.
+    # An amount of 0 keeps the missing amount.
+    is_missing = df["Unit"].isnull() | df["Amount"].isnull()
+    unit, amount = extract_units_and_amounts(df.loc[is_missing, "Grammage"])
+    df.loc[unit[unit.notna()].index, "Unit"] = unit[unit.notna()]
+    has_amount = amount.notna() & (amount != 0)
+    df.loc[amount[has_amount].index, "Amount"] = amount[has_amount]
 
     # Calculate the price per unit
-    df.loc[:, "Price per Unit"] = df.apply(parse_price_per_unit, axis=1)
+    amount = df["Amount"].to_numpy(dtype="float64")
+    price = get_euro_prices(df)
+    is_priced = ~np.isnan(price) & (amount > 0)
+    price_per_unit = np.full(len(df), np.nan)
+    price_per_unit[is_priced] = round_to_cents(price[is_priced] / amount[is_priced])
+    df.loc[:, "Price per Unit"] = price_per_unit
     return df
 
 
-def clean_rewe_dataset(df, weights_list_path):
-
+def load_weights_per_stueck_list(weights_list_path):
     with open(weights_list_path, "r") as f:
-        weights_per_stueck_list = json.load(f)
+        return json.load(f)
+
+
+def drop_names_seen_before(df, seen_name_hashes):
+    """
+    Drop the rows whose 'Original Name' was already kept in an earlier chunk.
+
+    seen_name_hashes is a sorted array with the 64-bit hashes of all names
+    kept so far, 8 bytes per distinct name. Returns the remaining rows and
+    the updated array.
+    """
+    name_hashes = pd.util.hash_pandas_object(
+        df["Original Name"], index=False
+    ).to_numpy()
+    positions = np.searchsorted(seen_name_hashes, name_hashes)
+    is_seen = np.zeros(len(df), dtype=bool)
+    is_inside = positions < len(seen_name_hashes)
+    is_seen[is_inside] = (
+        seen_name_hashes[positions[is_inside]] == name_hashes[is_inside]
+    )
+
+    # Both arrays are sorted, so the stable sort only merges two runs
+    seen_name_hashes = np.sort(
+        np.concatenate([seen_name_hashes, np.sort(name_hashes[~is_seen])]),
+        kind="stable",
+    )
+    return df[~is_seen], seen_name_hashes
+
+
+RAW_COLUMNS_TO_DROP = [
+    "Table Data",
+    "Unnamed: 0",
+    "Price",
+    "Grammage",
+    "IsOffer",
+    # "Category",
+]
+
+
+def clean_product_data(
+    df,
+    weights_per_stueck_list,
+    name_cache=None,
+    n_workers=None,
+    partition_by="category",
+):
+    # Cleaning steps after the filtering and deduplication of drop_unnecessary_data
+    if name_cache is not None:
+        return clean_product_data_with_name_cache(
+            df, weights_per_stueck_list, name_cache, n_workers, partition_by
+        )
+    if n_workers is not None and n_workers > 1 and len(df) > 0:
+        return clean_product_data_in_parallel(
+            df, weights_per_stueck_list, n_workers, partition_by
+        )
 
-    df = drop_unnecessary_data(df)
     df = remove_patterns(df)
     df = process_price_and_grammage(df)
     df = handle_stueck_entries(df, weights_per_stueck_list)
-    df.drop(
-        columns=[
-            "Table Data",
-            "Unnamed: 0",
-            "Price",
-            "Grammage",
-            "IsOffer",
-            # "Category",
-        ],
-        inplace=True,
+    df.drop(columns=RAW_COLUMNS_TO_DROP, inplace=True)
+    return df
+
+
+def split_into_partitions(df, n_partitions, partition_by="category"):
+    """
+    Split the rows into partitions by 'Category' or into contiguous row
+    ranges. Partitions keep the original row order and index.
+    """
+    if partition_by == "category":
+        return [
+            partition
+            for _, partition in df.groupby("Category", sort=False, dropna=False)
+        ]
+    if partition_by == "rows":
+        bounds = np.linspace(0, len(df), min(n_partitions, len(df)) + 1).astype(int)
+        return [df.iloc[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+    raise ValueError(f"Unsupported partitioning: {partition_by}")
+
+
+def clean_product_data_in_parallel(
+    df, weights_per_stueck_list, n_workers, partition_by="category"
+):
+    """
+    Run clean_product_data on partitions of the rows in a process pool and
+    reassemble the cleaned partitions in the original row order.
+
+    df is already deduplicated on 'Original Name' by drop_unnecessary_data,
+    the cleaning steps never drop rows, so the result is the same as
+    deduplicating the reassembled rows afterwards.
+    """
+    partitions = split_into_partitions(df, n_workers * 4, partition_by)
+    with ProcessPoolExecutor(max_workers=min(n_workers, len(partitions))) as executor:
+        dfs = list(
+            executor.map(
+                partial(
+                    clean_product_data,
+                    weights_per_stueck_list=weights_per_stueck_list,
+                ),
+                partitions,
+            )
+        )
+    return pd.concat(dfs).loc[df.index]
+
+
+def compute_unit_prices(df):
+    """
+    Price per Unit and Price per 100g from the Price, Unit, Amount and
+    Weight per Unit (g) columns, as computed by process_price_and_grammage
+    and handle_stueck_entries.
+    """
+    amount = df["Amount"].astype(float).to_numpy()
+    price = get_euro_prices(df)
+    is_priced = ~np.isnan(price) & (amount > 0)
+    price_per_unit = np.full(len(df), np.nan)
+    price_per_unit[is_priced] = round_to_cents(price[is_priced] / amount[is_priced])
+    df["Price per Unit"] = price_per_unit
+    df["Price per 100g"] = np.where(
+        df["Unit"] == "100g",
+        df["Price per Unit"],
+        (df["Price per Unit"] / df["Weight per Unit (g)"]) * 100,
+    )
+    return df
+
+
+def clean_product_data_with_name_cache(
+    df, weights_per_stueck_list, name_cache, n_workers=None, partition_by="category"
+):
+    """
+    Like clean_product_data, but the name, unit, amount and weight of
+    products whose raw name and grammage are in the name cache are looked up.
+    Only new products go through the parsing steps and are added to the
+    cache, prices are always computed from the current Price.
+    """
+    cached_df = name_cache.lookup(df["Original Name"], df["Grammage"])
+    is_new = ~df.index.isin(cached_df.index)
+    if is_new.any():
+        new_df = clean_product_data(
+            df[is_new].copy(),
+            weights_per_stueck_list,
+            n_workers=n_workers,
+            partition_by=partition_by,
+        )
+        name_cache.store(
+            df.loc[is_new, "Original Name"], df.loc[is_new, "Grammage"], new_df
+        )
+        cached_df = pd.concat(
+            [cached_df.astype(object), new_df[NAME_CACHE_COLUMNS].astype(object)]
+        )
+    cached_df = cached_df.loc[df.index]
+
+    df["Name"] = cached_df["Name"]
+    df["Unit"] = cached_df["Unit"]
+    # Stück counts are stored as text, like in handle_stueck_entries
+    amount = cached_df["Amount"].fillna(np.nan)
+    has_count = amount.map(type).eq(str).any()
+    df["Amount"] = amount if has_count else amount.astype(float)
+    df["Price per Unit"] = np.nan
+    df["Weight per Unit (g)"] = np.array(cached_df["Weight per Unit (g)"].tolist())
+    df = compute_unit_prices(df)
+
+    df.drop(columns=RAW_COLUMNS_TO_DROP, inplace=True)
+    return df
+
+
+def compact_dtypes(df):
+    """
+    Categoricals for Category and Unit, integer cents for the per-unit
+    price, float32 for amounts, weights and the per-100g price.
+    Stück counts in Amount become numbers.
+    """
+    df["Category"] = df["Category"].astype("category")
+    df["Unit"] = df["Unit"].astype(UNIT_DTYPE)
+    df["Amount"] = df["Amount"].astype("float32")
+    df["Weight per Unit (g)"] = df["Weight per Unit (g)"].astype("float32")
+    df["Price per Unit"] = np.rint(df["Price per Unit"] * 100).astype("Int32")
+    df["Price per 100g"] = df["Price per 100g"].astype("float32")
+    df.rename(columns={"Price per Unit": "Price per Unit (ct)"}, inplace=True)
+    return df
+
+
+def write_rewe_data(df, path):
+    # Parquet files keep the compact dtypes, everything else is written as csv
+    if path.endswith(".parquet"):
+        df.to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+
+
+def write_rewe_data_in_chunks(dfs, path):
+    """
+    Write cleaned chunks to one csv or parquet file as they are produced.
+    Returns the number of rows written.
+    """
+    n_rows = 0
+    writer = None
+    for i, df in enumerate(dfs):
+        if not path.endswith(".parquet"):
+            df.to_csv(path, mode="w" if i == 0 else "a", header=i == 0, index=False)
+        elif len(df) > 0:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table.cast(writer.schema))
+        n_rows += len(df)
+
+    if writer is not None:
+        writer.close()
+    elif path.endswith(".parquet"):
+        # Only empty chunks
+        df.to_parquet(path, index=False)
+    return n_rows
+
+
+def open_name_cache(weights_per_stueck_list, path):
+    name_patterns = load_rewe_cleaning_rules()["name_patterns"]
+    version = get_name_cache_version(name_patterns, weights_per_stueck_list)
+    return ReweNameCache(version, path)
+
+
+@tracked_stage()
+def clean_rewe_dataset(
+    df, weights_list_path, name_cache_path=None, n_workers=None, partition_by="category"
+):
+    """
+    With a name_cache_path, the parsed names of products that were cleaned
+    before are looked up in a persistent cache instead of parsed again.
+    With n_workers > 1, the products are cleaned in a process pool, in
+    partitions by 'Category' or by row ranges (partition_by="rows").
+    """
+    weights_per_stueck_list = load_weights_per_stueck_list(weights_list_path)
+    name_cache = None
+    if name_cache_path is not None:
+        name_cache = open_name_cache(weights_per_stueck_list, name_cache_path)
+
+    df = drop_unnecessary_data(df)
+    df = clean_product_data(
+        df,
+        weights_per_stueck_list,
+        name_cache,
+        n_workers=n_workers,
+        partition_by=partition_by,
     )
+    df = compact_dtypes(df)
+
+    if name_cache is not None:
+        name_cache.close()
     return df
+
+
+def clean_rewe_dataset_in_chunks(
+    raw_data_path,
+    output_path,
+    weights_list_path,
+    chunksize=REWE_CHUNKSIZE,
+    name_cache_path=None,
+    n_workers=None,
+    partition_by="category",
+):
+    """
+    Clean the raw scrape csv chunk by chunk and append every cleaned chunk to
+    the output csv or parquet file, so memory stays flat no matter how large
+    the input is.
+
+    Products are deduplicated on 'Original Name' across chunks through the
+    hashes of the names kept so far. Like in clean_rewe_dataset, the first
+    occurrence of a name is kept, so both produce the same output file.
+    """
+    weights_per_stueck_list = load_weights_per_stueck_list(weights_list_path)
+    name_cache = None
+    if name_cache_path is not None:
+        name_cache = open_name_cache(weights_per_stueck_list, name_cache_path)
+
+    def iter_cleaned_chunks():
+        seen_name_hashes = np.empty(0, dtype="uint64")
+        chunks = pd.read_csv(raw_data_path, chunksize=chunksize, dtype=REWE_TEXT_DTYPES)
+        for df in chunks:
+            df = drop_unnecessary_data(df)
+            df, seen_name_hashes = drop_names_seen_before(df, seen_name_hashes)
+            df = clean_product_data(
+                df,
+                weights_per_stueck_list,
+                name_cache,
+                n_workers=n_workers,
+                partition_by=partition_by,
+            )
+            yield compact_dtypes(df)
+
+    n_rows = write_rewe_data_in_chunks(iter_cleaned_chunks(), output_path)
+
+    if name_cache is not None:
+        name_cache.close()
+    return n_rows
@@ -0,0 +1,96 @@
+import os
+import time
+import numpy as np
+import pandas as pd
+
+REWE_SNAPSHOT_PATH = "data/raw/rewe_snapshot.parquet"
+# Changed products of one delta crawl, next to the full scrape and not over it
+REWE_DELTA_OUTPUT_PATH = "data/raw/rewe_delta_{date}.csv"
+
+# Fields of the listing pages that are tracked between crawls
+LISTING_FIELDS = ["Price", "IsOffer", "Grammage"]
+SNAPSHOT_COLUMNS = ["Product Key", "Listing Hash", "Detail Href", "Name", "Last Seen"]
+
+
+def get_delta_output_path():
+    return REWE_DELTA_OUTPUT_PATH.format(date=time.strftime("%Y%m%d"))
+
+
+def get_product_keys(df):
+    """Hash of the detail href of every product, of the name if it has none."""
+    keys = df["Detail Href"].fillna(df["Name"]) if "Detail Href" in df else df["Name"]
+    return pd.util.hash_pandas_object(keys.astype(str), index=False).to_numpy()
+
+
+def get_listing_hashes(df):
+    return pd.util.hash_pandas_object(
+        df[LISTING_FIELDS].astype(str), index=False
+    ).to_numpy()
+
+
+def load_snapshot(path=REWE_SNAPSHOT_PATH):
+    if not os.path.isfile(path):
+        return pd.DataFrame(
+            {
+                "Product Key": pd.Series(dtype="uint64"),
+                "Listing Hash": pd.Series(dtype="uint64"),
+                "Detail Href": pd.Series(dtype=object),
+                "Name": pd.Series(dtype=object),
+                "Last Seen": pd.Series(dtype=object),
+            }
+        )
+    return pd.read_parquet(path)
+
+
+def get_changed_products(df, snapshot):
+    """
+    Products of the crawl that are not in the snapshot ("new") or whose
+    price, offer flag or grammage changed ("changed"), each product once.
+    """
+    df = df.assign(
+        **{"Product Key": get_product_keys(df), "Listing Hash": get_listing_hashes(df)}
+    )
+    # Products listed in several categories are compared once
+    df = df.drop_duplicates(subset=["Product Key"], keep="first")
+
+    positions = pd.Index(snapshot["Product Key"]).get_indexer(df["Product Key"])
+    is_new = positions == -1
+    is_changed = np.zeros(len(df), dtype=bool)
+    is_changed[~is_new] = (
+        snapshot["Listing Hash"].to_numpy()[positions[~is_new]]
+        != df["Listing Hash"].to_numpy()[~is_new]
+    )
+
+    df["Change"] = None
+    df.loc[is_new, "Change"] = "new"
+    df.loc[is_changed, "Change"] = "changed"
+    return df[is_new | is_changed].drop(columns=["Product Key", "Listing Hash"])
+
+
+def update_snapshot(df, snapshot, path=REWE_SNAPSHOT_PATH):
+    """
+    Replace the snapshot entries of all crawled products. Products that were
+    not listed in this crawl are kept, so they are not new when they return.
+    """
+    current = pd.DataFrame(
+        {
+            "Product Key": get_product_keys(df),
+            "Listing Hash": get_listing_hashes(df),
+            "Detail Href": df["Detail Href"].to_numpy(),
+            "Name": df["Name"].to_numpy(),
+            "Last Seen": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+    ).drop_duplicates(subset=["Product Key"], keep="first")
+    snapshot = pd.concat(
+        [
+            current,
+            snapshot[~snapshot["Product Key"].isin(current["Product Key"])],
+        ],
+        ignore_index=True,
+    )
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    snapshot[SNAPSHOT_COLUMNS].to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+    return snapshot
@@ -0,0 +1,195 @@
+import os
+import time
+import sqlite3
+import urllib.request
+import urllib.error
+from urllib.parse import urljoin
+
+from src.rewe_data.throttling import throttle
+
+REWE_DETAIL_CACHE_PATH = "data/processed/rewe_detail_cache.sqlite"
+REWE_DETAIL_CACHE_TTL_DAYS = 30
+
+
+def request_validators(url, etag=None, last_modified=None, timeout=10):
+    """
+    Conditional HEAD request for a detail page. Returns whether the page is
+    unchanged since etag / last_modified (304), and the current validators.
+    """
+    request = urllib.request.Request(url, method="HEAD")
+    if etag:
+        request.add_header("If-None-Match", etag)
+    if last_modified:
+        request.add_header("If-Modified-Since", last_modified)
+
+    with throttle.request():
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                headers = response.headers
+                is_unchanged = False
+        except urllib.error.HTTPError as e:
+            if e.code != 304:
+                raise
+            headers = e.headers
+            is_unchanged = True
+    return (
+        is_unchanged,
+        headers.get("ETag", etag),
+        headers.get("Last-Modified", last_modified),
+    )
+
+
+# Cached fields, the detail keys and their columns
+DETAIL_COLUMNS = {
+    "Regulated Product Name": "regulated_product_name",
+    "Nutritional Data": "nutritional_data",
+}
+
+
+class ReweDetailCache:
+    """
+    Persistent cache of the nutrition table and regulated product name
+    extracted from a product detail page, keyed by the detail href.
+
+    Every field has its own fetch time, so a run that extracts only one of
+    them does not extend the age of the other. Fields younger than ttl_days
+    are returned as they are. With revalidate, older entries that have an
+    ETag or Last-Modified value are checked with a conditional HEAD request
+    and kept if the page did not change, so only new or changed products
+    need the browser.
+    """
+
+    def __init__(
+        self,
+        path=REWE_DETAIL_CACHE_PATH,
+        ttl_days=REWE_DETAIL_CACHE_TTL_DAYS,
+        base_url="https://shop.rewe.de/",
+        revalidate=False,
+    ):
+        self.ttl_s = ttl_days * 24 * 60 * 60
+        self.base_url = base_url
+        self.revalidate = revalidate
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.connection = sqlite3.connect(path)
+
+        # Caches with one fetch time for all fields are rebuilt
+        columns = {
+            row[1] for row in self.connection.execute("PRAGMA table_info(details)")
+        }
+        if columns and "nutritional_data_fetched_at" not in columns:
+            self.connection.execute("DROP TABLE details")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS details (
+                href TEXT PRIMARY KEY,
+                regulated_product_name TEXT,
+                regulated_product_name_fetched_at REAL,
+                nutritional_data TEXT,
+                nutritional_data_fetched_at REAL,
+                etag TEXT,
+                last_modified TEXT
+            )
+            """)
+        self.connection.commit()
+
+    def get_url(self, href):
+        return urljoin(self.base_url, href)
+
+    def lookup(self, href, keys):
+        """
+        Cached details of the product with all the given keys ("Regulated
+        Product Name", "Nutritional Data"), None if the product has to be
+        extracted again.
+        """
+        columns = [DETAIL_COLUMNS[key] for key in keys]
+        row = self.connection.execute(
+            "SELECT "
+            + ", ".join(f"{column}, {column}_fetched_at" for column in columns)
+            + ", etag, last_modified FROM details WHERE href = ?",
+            (href,),
+        ).fetchone()
+        if row is None:
+            return None
+
+        *values, etag, last_modified = row
+        details = dict(zip(keys, values[::2]))
+        fetched_at = values[1::2]
+        if any(details[key] is None for key in keys):
+            return None
+
+        if time.time() - min(fetched_at) > self.ttl_s:
+            if not self.revalidate or not (etag or last_modified):
+                return None
+            try:
+                is_unchanged, etag, last_modified = request_validators(
+                    self.get_url(href), etag, last_modified
+                )
+            except (urllib.error.URLError, OSError):
+                return None
+            if not is_unchanged:
+                return None
+            # The page did not change, so all cached fields are still valid
+            now = time.time()
+            self.connection.execute(
+                "UPDATE details SET "
+                + ", ".join(
+                    f"{column}_fetched_at = "
+                    f"CASE WHEN {column} IS NULL THEN {column}_fetched_at ELSE ? END"
+                    for column in DETAIL_COLUMNS.values()
+                )
+                + ", etag = ?, last_modified = ? WHERE href = ?",
+                (*[now] * len(DETAIL_COLUMNS), etag, last_modified, href),
+            )
+            self.connection.commit()
+
+        return details
+
+    def store(self, href, details):
+        """
+        Store the extracted details. Fields that were not extracted keep
+        their cached value and fetch time. The ETag and Last-Modified values
+        are only replaced when all fields were extracted, so they never
+        vouch for a field from an older version of the page.
+        """
+        values = [details.get(key) for key in DETAIL_COLUMNS]
+        is_complete = all(value is not None for value in values)
+        etag, last_modified = None, None
+        if self.revalidate and is_complete:
+            try:
+                _, etag, last_modified = request_validators(self.get_url(href))
+            except (urllib.error.URLError, OSError):
+                pass
+
+        now = time.time()
+        fetched_at = [None if value is None else now for value in values]
+        field_updates = ",\n".join(
+            f"{column} = COALESCE(excluded.{column}, {column}),\n"
+            f"{column}_fetched_at = COALESCE("
+            f"excluded.{column}_fetched_at, {column}_fetched_at)"
+            for column in DETAIL_COLUMNS.values()
+        )
+        validator_updates = (
+            "etag = excluded.etag, last_modified = excluded.last_modified"
+            if is_complete
+            else "etag = etag, last_modified = last_modified"
+        )
+        self.connection.execute(
+            f"""
+            INSERT INTO details VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (href) DO UPDATE SET
+                {field_updates},
+                {validator_updates}
+            """,
+            (
+                href,
+                values[0],
+                fetched_at[0],
+                values[1],
+                fetched_at[1],
+                etag,
+                last_modified,
+            ),
+        )
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
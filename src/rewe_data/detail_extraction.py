@@ -0,0 +1,144 @@
+import queue
+import threading
+from concurrent.futures import Future, TimeoutError
+from urllib.parse import urljoin
+
+from selenium.common.exceptions import WebDriverException
+
+from src.rewe_data.scraping import (
+    read_nutrition_table,
+    read_regulated_product_name,
+    complete_details,
+)
+from src.rewe_data.throttling import throttle
+
+
+class DetailExtractionPool:
+    """
+    Extract nutrition tables and regulated product names from product detail
+    pages with one worker thread per driver session. Every worker opens its
+    own tab and takes product hrefs from a shared queue, so up to
+    len(drivers) detail pages load at the same time.
+
+    A detail page that takes longer than timeout seconds, or fails, has no
+    result, and gets the same empty result as in the serial extraction, so
+    one slow product never stalls the crawl. A nutrition table that did not
+    load in time is None in the result.
+    """
+
+    def __init__(
+        self,
+        drivers,
+        base_url,
+        extract_nutrition=False,
+        extract_regulated_product_name=False,
+        timeout=10,
+    ):
+        self.base_url = base_url
+        self.extract_nutrition = extract_nutrition
+        self.extract_regulated_product_name = extract_regulated_product_name
+        self.timeout = timeout
+        self.queue = queue.Queue()
+        self.workers = [
+            threading.Thread(target=self.work, args=(driver,), daemon=True)
+            for driver in drivers
+        ]
+        for worker in self.workers:
+            worker.start()
+
+    def get_detail_keys(self):
+        detail_keys = []
+        if self.extract_regulated_product_name:
+            detail_keys.append("Regulated Product Name")
+        if self.extract_nutrition:
+            detail_keys.append("Nutritional Data")
+        return detail_keys
+
+    def extract(self, driver, href):
+        result = {}
+        with throttle.request():
+            driver.get(urljoin(self.base_url, href))
+            if self.extract_regulated_product_name:
+                result["Regulated Product Name"] = read_regulated_product_name(
+                    driver, timeout=self.timeout
+                )
+            if self.extract_nutrition:
+                result["Nutritional Data"] = read_nutrition_table(
+                    driver, timeout=self.timeout
+                )
+        return result
+
+    def work(self, driver):
+        driver.switch_to.new_window("tab")
+        driver.set_page_load_timeout(self.timeout)
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            href, future = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(self.extract(driver, href))
+            except WebDriverException:
+                future.set_result(None)
+            except Exception as e:
+                # Any other error fails this product only, the tab keeps working
+                future.set_exception(e)
+
+        try:
+            driver.close()
+        except WebDriverException:
+            pass
+
+    def submit(self, href):
+        """Queue a product detail page, returns a Future of its result dict."""
+        future = Future()
+        self.queue.put((href, future))
+        return future
+
+    def get_result(self, future):
+        """Result dict of a submitted page, None if it failed or timed out."""
+        # Waiting time covers page load and the waits for the table rows
+        try:
+            return future.result(timeout=3 * self.timeout)
+        except TimeoutError:
+            return None
+        except Exception as e:
+            print(f"Detail page extraction failed: {e!r}")
+            return None
+
+    def close(self):
+        for _ in self.workers:
+            self.queue.put(None)
+        for worker in self.workers:
+            worker.join(timeout=3 * self.timeout)
+
+
+def extract_details(hrefs, detail_pool, detail_cache=None):
+    """
+    Details of the products with the given detail hrefs, from the cache if
+    possible and from the pool otherwise, in the order of hrefs, and whether
+    all details of a product were read. Details that timed out or failed
+    have the empty values.
+    """
+    detail_keys = detail_pool.get_detail_keys()
+    details = [None] * len(hrefs)
+    if detail_cache is not None:
+        details = [detail_cache.lookup(href, detail_keys) for href in hrefs]
+    is_complete = [cached is not None for cached in details]
+
+    futures = [
+        detail_pool.submit(href) if cached is None else None
+        for href, cached in zip(hrefs, details)
+    ]
+    for i, future in enumerate(futures):
+        if future is None:
+            continue
+        # Timed out or failed pages are not cached, so they are tried again
+        details[i], is_complete[i] = complete_details(
+            detail_pool.get_result(future), detail_keys
+        )
+        if detail_cache is not None and is_complete[i]:
+            detail_cache.store(hrefs[i], details[i])
+    return details, is_complete
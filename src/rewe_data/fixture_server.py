@@ -0,0 +1,48 @@
+import os
+import argparse
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+from src.rewe_data.http_fetching import get_fixture_path
+
+
+class FixtureRequestHandler(SimpleHTTPRequestHandler):
+    """Serves the pages recorded by fetch_category_pages(record_dir=...)."""
+
+    def __init__(self, *args, record_dir, **kwargs):
+        self.record_dir = record_dir
+        super().__init__(*args, directory=record_dir, **kwargs)
+
+    def do_GET(self):
+        path = get_fixture_path(self.record_dir, self.path)
+        if not os.path.isfile(path):
+            self.send_error(404, f"No recorded page for {self.path}")
+            return
+
+        with open(path, "rb") as f:
+            body = f.read()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_fixture_server(record_dir, port=8000):
+    """Server for the recorded pages, run it with serve_forever()."""
+    handler = partial(FixtureRequestHandler, record_dir=record_dir)
+    return ThreadingHTTPServer(("localhost", port), handler)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--record_dir", type=str, default="data/fixtures/rewe")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    server = make_fixture_server(args.record_dir, args.port)
+    print(f"Serving {args.record_dir} on http://localhost:{args.port}/")
+    server.serve_forever()
@@ -0,0 +1,215 @@
+import os
+import time
+import asyncio
+from urllib.parse import urljoin, urlsplit, urlencode, parse_qs
+
+import aiohttp
+import pandas as pd
+from bs4 import BeautifulSoup
+
+from src.rewe_data.scraping import (
+    parse_listing_page,
+    get_number_of_pages_from_page_source,
+)
+from src.rewe_data.throttling import throttle
+
+DEFAULT_HEADERS = {
+    "User-Agent": (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+        "(KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36 Edg/124.0.0.0"
+    ),
+    "Accept-Language": "de-DE,de;q=0.9",
+}
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def get_page_url(category_url, page):
+    if page == 1:
+        return category_url
+    return f"{category_url.split('?')[0]}?{urlencode({'page': page})}"
+
+
+def get_fixture_path(record_dir, url):
+    """
+    File of a recorded page, e.g. <record_dir>/c/obst-gemuese/page_2.html
+    for https://shop.rewe.de/c/obst-gemuese/?page=2.
+    """
+    parts = urlsplit(url)
+    page = parse_qs(parts.query).get("page", ["1"])[0]
+    return os.path.join(record_dir, parts.path.strip("/"), f"page_{page}.html")
+
+
+def parse_category_links(page_source, base_url):
+    """(name, url) of the category tiles on the shop's home page."""
+    soup = BeautifulSoup(page_source, "html.parser")
+    categories = []
+    for tile in soup.find_all(class_="home-page-category-tile"):
+        link = tile if tile.name == "a" else tile.find("a")
+        if link is None or not link.get("href"):
+            continue
+        name = tile.get("aria-label") or tile.get_text(strip=True)
+        categories.append((name, urljoin(base_url, link["href"])))
+    return categories
+
+
+async def fetch_page(session, url, semaphore, record_dir=None, retries=3):
+    """
+    GET one page while holding the semaphore, paced by the shared throttle.
+    Timeouts, connection errors and 429/5xx responses slow the throttle down
+    and are retried with exponential backoff. Other error statuses, e.g. 404,
+    raise at once.
+    """
+    for attempt in range(retries + 1):
+        try:
+            async with semaphore:
+                await throttle.acquire_async()
+                start = time.perf_counter()
+                async with session.get(url) as response:
+                    response.raise_for_status()
+                    page_source = await response.text()
+            throttle.record(time.perf_counter() - start)
+            break
+        except aiohttp.ClientResponseError as e:
+            if e.status not in RETRY_STATUSES:
+                # The server answered, so the request does not slow the throttle
+                throttle.record(time.perf_counter() - start)
+                raise
+            throttle.record(time.perf_counter() - start, ok=False)
+            if attempt == retries:
+                raise
+            await asyncio.sleep(2**attempt)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            throttle.record(time.perf_counter() - start, ok=False)
+            if attempt == retries:
+                raise
+            await asyncio.sleep(2**attempt)
+
+    if record_dir is not None:
+        path = get_fixture_path(record_dir, url)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(page_source)
+    return page_source
+
+
+async def fetch_category(
+    session,
+    name,
+    category_url,
+    semaphore,
+    record_dir=None,
+    parser="lxml",
+    with_detail_href=False,
+):
+    # The first page tells how many pages the category has
+    first_page = await fetch_page(session, category_url, semaphore, record_dir)
+    n_pages = get_number_of_pages_from_page_source(first_page, parser=parser)
+    page_urls = [get_page_url(category_url, page) for page in range(2, n_pages + 1)]
+    other_pages = await asyncio.gather(
+        *[fetch_page(session, url, semaphore, record_dir) for url in page_urls],
+        return_exceptions=True,
+    )
+
+    product_dicts = []
+    for url, page_source in zip([category_url, *page_urls], [first_page, *other_pages]):
+        if isinstance(page_source, BaseException):
+            print(f"Skipping page {url}: {page_source}")
+            continue
+        product_dicts += parse_listing_page(
+            page_source, name, parser=parser, with_detail_href=with_detail_href
+        )
+    return product_dicts
+
+
+async def fetch_category_pages_async(
+    base_url,
+    categories=None,
+    max_concurrency=8,
+    timeout=30,
+    record_dir=None,
+    parser="lxml",
+    with_detail_href=False,
+):
+    semaphore = asyncio.Semaphore(max_concurrency)
+    async with aiohttp.ClientSession(
+        headers=DEFAULT_HEADERS,
+        timeout=aiohttp.ClientTimeout(total=timeout),
+        connector=aiohttp.TCPConnector(limit=max_concurrency),
+    ) as session:
+        if categories is None:
+            home_page = await fetch_page(session, base_url, semaphore, record_dir)
+            categories = parse_category_links(home_page, base_url)
+
+        category_product_dicts = await asyncio.gather(
+            *[
+                fetch_category(
+                    session,
+                    name,
+                    url,
+                    semaphore,
+                    record_dir,
+                    parser,
+                    with_detail_href,
+                )
+                for name, url in categories
+            ],
+            return_exceptions=True,
+        )
+
+    all_product_dicts = []
+    failed_categories = []
+    for (name, url), product_dicts in zip(categories, category_product_dicts):
+        if isinstance(product_dicts, BaseException):
+            print(f"Skipping category {name} ({url}): {product_dicts}")
+            failed_categories.append(name)
+            continue
+        all_product_dicts += product_dicts
+
+    if failed_categories:
+        print(
+            f"{len(failed_categories)} of {len(categories)} categories failed: "
+            + ", ".join(failed_categories)
+        )
+    # Blocked, offline or a wrong URL, nothing that could be saved
+    if not all_product_dicts:
+        raise RuntimeError(
+            f"No products fetched from {base_url}, "
+            f"{len(failed_categories)} of {len(categories)} categories failed"
+        )
+    return all_product_dicts
+
+
+def fetch_category_pages(
+    base_url,
+    categories=None,
+    max_concurrency=8,
+    timeout=30,
+    record_dir=None,
+    parser="lxml",
+    with_detail_href=False,
+):
+    """
+    Fetch the listing pages of all categories over plain HTTP, at most
+    max_concurrency requests at a time, and parse them with the lxml or bs4
+    parser of parse_listing_page. Categories are (name, url) pairs and are read
+    from the home page if not given. Products keep the category and page
+    order of the shop. Pages that still fail after the retries are skipped
+    with a message, and a category whose first page fails is skipped as a
+    whole, so the products of all other pages are kept. Raises a
+    RuntimeError if no products could be fetched at all.
+
+    With a record_dir, every fetched page is also saved there, so the run can
+    be replayed offline with fixture_server.py.
+    """
+    product_dicts = asyncio.run(
+        fetch_category_pages_async(
+            base_url,
+            categories=categories,
+            max_concurrency=max_concurrency,
+            timeout=timeout,
+            record_dir=record_dir,
+            parser=parser,
+            with_detail_href=with_detail_href,
+        )
+    )
+    return pd.DataFrame(product_dicts)
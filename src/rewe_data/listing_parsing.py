@@ -0,0 +1,93 @@
+from lxml import etree, html
+
+
+def has_class(name):
+    # XPath for elements whose class attribute contains the class name
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+# Compiled once, every listing page reuses them
+PRODUCTS_XPATH = etree.XPath(f"//div[{has_class('search-service-product')}]")
+NAME_XPATH = etree.XPath(
+    f".//h4[{has_class('ProductDetailsWrapper_productTitle__XjgsA')}]"
+)
+OFFER_PRICE_XPATH = etree.XPath(
+    f".//div[{has_class('search-service-productOfferPrice')}]"
+)
+PRICE_XPATH = etree.XPath(f".//div[{has_class('search-service-productPrice')}]")
+GRAMMAGE_XPATH = etree.XPath(
+    f".//div[{has_class('ProductGrammage_productGrammage__fMOJr')}]"
+)
+IMAGE_XPATH = etree.XPath(".//img")
+DETAIL_HREF_XPATH = etree.XPath(
+    f".//a[{has_class('search-service-productDetailsLink')}]/@href"
+)
+PAGINATION_BUTTONS_XPATH = etree.XPath(
+    f"(//div[{has_class('Pagination_paginationPagesContainer__b2Lv_')}])[1]//button"
+)
+TEXT_XPATH = etree.XPath(".//text()")
+
+
+def get_text(element):
+    # Same as BeautifulSoup's get_text(strip=True)
+    return "".join(text.strip() for text in TEXT_XPATH(element))
+
+
+def get_first_text(xpath, product):
+    elements = xpath(product)
+    return get_text(elements[0]) if elements else None
+
+
+def parse_listing_page_lxml(page_source, category, with_detail_href=False):
+    """
+    lxml version of scraping.parse_listing_page, which reads every field of a
+    product with one of the precompiled XPath expressions above.
+    """
+    if not page_source.strip():
+        return []
+    tree = html.fromstring(page_source)
+    product_dicts = []
+    for product in PRODUCTS_XPATH(tree):
+        name = get_first_text(NAME_XPATH, product)
+        product_dict = {
+            "Name": name if name is not None else "Name not found",
+            "Price": None,
+            "Grammage": None,
+            "IsOffer": False,
+            "Category": category,
+            "Table Data": None,
+        }
+
+        offer_price = get_first_text(OFFER_PRICE_XPATH, product)
+        if offer_price is not None:
+            product_dict["Price"] = offer_price
+            product_dict["IsOffer"] = True
+        else:
+            product_dict["Price"] = get_first_text(PRICE_XPATH, product)
+
+        grammage = get_first_text(GRAMMAGE_XPATH, product)
+        product_dict["Grammage"] = (
+            grammage if grammage is not None else "Grammage not found"
+        )
+
+        images = IMAGE_XPATH(product)
+        product_dict["Image URL"] = images[0].get("src") if images else None
+
+        if with_detail_href:
+            hrefs = DETAIL_HREF_XPATH(product)
+            product_dict["Detail Href"] = hrefs[0] if hrefs else None
+        product_dicts.append(product_dict)
+    return product_dicts
+
+
+def get_number_of_pages_lxml(page_source):
+    if not page_source.strip():
+        return 1
+    page_numbers = [
+        int(text)
+        for text in map(
+            get_text, PAGINATION_BUTTONS_XPATH(html.fromstring(page_source))
+        )
+        if text.isdigit()
+    ]
+    return max(page_numbers, default=1)
@@ -0,0 +1,109 @@
+import os
+import json
+import hashlib
+import sqlite3
+import numpy as np
+import pandas as pd
+
+REWE_NAME_CACHE_PATH = "data/processed/rewe_name_cache.sqlite"
+
+# Bump when the name, unit, amount or weight parsing in cleaning.py changes
+REWE_NAME_CACHE_CODE_VERSION = 2
+
+# Columns that only depend on the raw name and grammage of a product
+NAME_CACHE_COLUMNS = ["Name", "Unit", "Amount", "Weight per Unit (g)"]
+
+
+def get_name_cache_version(name_patterns, weights_per_stueck_list):
+    """Hash of everything the cached columns depend on besides name and grammage."""
+    rules = {
+        "name_patterns": list(name_patterns),
+        "weights_per_stueck_list": weights_per_stueck_list,
+        "code_version": REWE_NAME_CACHE_CODE_VERSION,
+    }
+    return hashlib.sha256(
+        json.dumps(rules, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    ).hexdigest()[:16]
+
+
+def to_sqlite_value(value):
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return None
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+class ReweNameCache:
+    """
+    Persistent memo of the cleaned name, unit, amount (or Stück count) and
+    weight per unit of a product, keyed by its raw name and grammage.
+
+    Entries are stored together with a version hash of the cleaning rules.
+    Opening the cache with another version drops all entries, so changed
+    patterns, weights or parsing code never return stale results.
+    """
+
+    def __init__(self, version, path=REWE_NAME_CACHE_PATH):
+        self.version = version
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS names (
+                version TEXT,
+                raw_name TEXT,
+                grammage TEXT,
+                name TEXT,
+                unit TEXT,
+                amount,
+                weight,
+                PRIMARY KEY (version, raw_name, grammage)
+            )
+            """)
+        self.connection.execute("DELETE FROM names WHERE version != ?", (version,))
+        self.connection.commit()
+
+        entries = pd.read_sql_query(
+            "SELECT raw_name, grammage, name, unit, amount, weight "
+            "FROM names WHERE version = ?",
+            self.connection,
+            params=(version,),
+            dtype=object,
+        )
+        self.keys = pd.MultiIndex.from_frame(entries[["raw_name", "grammage"]])
+        self.values = entries[["name", "unit", "amount", "weight"]].to_numpy()
+
+    def lookup(self, raw_names, grammages):
+        """
+        Returns the cached NAME_CACHE_COLUMNS for the products that are in the
+        cache, indexed like raw_names. Products that are not cached are absent.
+        """
+        positions = self.keys.get_indexer(
+            pd.MultiIndex.from_arrays([raw_names, grammages])
+        )
+        is_cached = positions >= 0
+        return pd.DataFrame(
+            self.values[positions[is_cached]],
+            index=raw_names.index[is_cached],
+            columns=NAME_CACHE_COLUMNS,
+        )
+
+    def store(self, raw_names, grammages, df):
+        rows = [
+            (self.version, raw_name, grammage, *map(to_sqlite_value, values))
+            for raw_name, grammage, values in zip(
+                raw_names, grammages, df[NAME_CACHE_COLUMNS].itertuples(index=False)
+            )
+        ]
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO names VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+        )
+        self.connection.commit()
+
+        self.keys = self.keys.append(pd.MultiIndex.from_arrays([raw_names, grammages]))
+        self.values = np.concatenate(
+            [self.values, df[NAME_CACHE_COLUMNS].to_numpy(dtype=object)]
+        )
+
+    def close(self):
+        self.connection.close()
@@ -1,4 +1,9 @@
-from src.rewe_data.cleaning import clean_rewe_dataset
+from src.rewe_data.cleaning import (
+    clean_rewe_dataset,
+    clean_rewe_dataset_in_chunks,
+    write_rewe_data,
+)
+from src.rewe_data.name_cache import REWE_NAME_CACHE_PATH
 
 import pandas as pd
 import argparse
@@ -16,17 +21,72 @@ parser.add_argument(
     default="data/raw/rewe_weights_per_stueck_list.json",
 )
 parser.add_argument(
-    "--output_path", type=str, default="data/processed/cleaned_rewe_dataset.csv"
+    "--output_path",
+    help="A .parquet output keeps the compact dtypes of the cleaned dataset",
+    type=str,
+    default="data/processed/cleaned_rewe_dataset.csv",
+)
+parser.add_argument(
+    "--chunksize",
+    help="Clean the raw csv in chunks of this many rows instead of all at once",
+    type=int,
+    default=None,
+)
+parser.add_argument(
+    "--name_cache_path",
+    help="Cache of the parsed names of products that were cleaned before",
+    type=str,
+    default=REWE_NAME_CACHE_PATH,
+)
+parser.add_argument(
+    "--no_name_cache",
+    help="Parse all product names instead of using the name cache",
+    action="store_true",
+    default=False,
+)
+parser.add_argument(
+    "--n_workers",
+    help="Clean the products in this many worker processes",
+    type=int,
+    default=None,
+)
+parser.add_argument(
+    "--partition_by",
+    help="How the products are split between the workers",
+    type=str,
+    choices=["category", "rows"],
+    default="category",
 )
 args = parser.parse_args()
 
 
 def main():
+    name_cache_path = None if args.no_name_cache else args.name_cache_path
+    if args.chunksize is not None:
+        print(f"Cleaning {args.raw_data_path} in chunks of {args.chunksize} rows")
+        n_rows = clean_rewe_dataset_in_chunks(
+            args.raw_data_path,
+            args.output_path,
+            args.weights_list_path,
+            chunksize=args.chunksize,
+            name_cache_path=name_cache_path,
+            n_workers=args.n_workers,
+            partition_by=args.partition_by,
+        )
+        print(f"Saved {n_rows} cleaned products to {args.output_path}")
+        return
+
     df = pd.read_csv(args.raw_data_path)
-    df = clean_rewe_dataset(df, args.weights_list_path)
+    df = clean_rewe_dataset(
+        df,
+        args.weights_list_path,
+        name_cache_path=name_cache_path,
+        n_workers=args.n_workers,
+        partition_by=args.partition_by,
+    )
 
     print(f"\n\n\nSaving cleaned dataset to {args.output_path}")
-    df.to_csv(args.output_path, index=False)
+    write_rewe_data(df, args.output_path)
 
 
 if __name__ == "__main__":
@@ -9,12 +9,29 @@ from src.rewe_data.page_navigation import (
     go_next_page,
     go_back,
     get_number_of_product_categories,
-    random_sleep,
     go_to_next_category,
     get_number_of_pages,
 )
+from src.my_mlflow.stage_tracking import track_stage
 from src.rewe_data.scraping import (
     scrape_product_category_data_from_page,
+    get_empty_details,
+)
+from src.rewe_data.http_fetching import fetch_category_pages
+from src.rewe_data.detail_extraction import DetailExtractionPool, extract_details
+from src.rewe_data.delta_crawl import (
+    REWE_SNAPSHOT_PATH,
+    get_delta_output_path,
+    load_snapshot,
+    get_changed_products,
+    update_snapshot,
+)
+from src.rewe_data.checkpointing import ScrapeCheckpoint, get_checkpoint_dir
+from src.rewe_data.throttling import throttle
+from src.rewe_data.detail_cache import (
+    ReweDetailCache,
+    REWE_DETAIL_CACHE_PATH,
+    REWE_DETAIL_CACHE_TTL_DAYS,
 )
 
 parser = argparse.ArgumentParser()
@@ -33,8 +50,9 @@ parser.add_argument(
 )
 parser.add_argument(
     "--output_path",
-    help="Where to story your scraped dataset",
-    default="data/raw/rewe_dataset.csv",
+    help="Where to story your scraped dataset, defaults to "
+    "data/raw/rewe_dataset.csv and to data/raw/rewe_delta_<date>.csv with --delta",
+    default=None,
 )
 parser.add_argument("--remote_debugging_port", help="Debugging Port", default=9222)
 parser.add_argument(
@@ -45,57 +63,311 @@ parser.add_argument(
 parser.add_argument(
     "--url", help="URL to the Rewe Website", default="https://shop.rewe.de/"
 )
+parser.add_argument(
+    "--engine",
+    help="Fetch the listing pages over plain HTTP or through the Edge browser, "
+    "defaults to selenium with detail page extraction and to http otherwise",
+    type=str,
+    choices=["http", "selenium"],
+    default=None,
+)
+parser.add_argument(
+    "--max_concurrency",
+    help="Parallel requests of the http engine",
+    type=int,
+    default=8,
+)
+parser.add_argument(
+    "--record_dir",
+    help="Save every page fetched by the http engine here, for fixture_server.py",
+    type=str,
+    default=None,
+)
+parser.add_argument(
+    "--parser",
+    help="HTML parser of the listing pages of both engines",
+    type=str,
+    choices=["lxml", "bs4"],
+    default="lxml",
+)
+parser.add_argument(
+    "--n_detail_workers",
+    help="Browser tabs that extract product detail pages in parallel, "
+    "0 extracts them one at a time in the listing tab",
+    type=int,
+    default=4,
+)
+parser.add_argument(
+    "--detail_timeout",
+    help="Seconds a detail worker waits for a product page",
+    type=float,
+    default=10,
+)
+parser.add_argument(
+    "--detail_cache_path",
+    help="Cache of the nutrition tables and regulated names of known products",
+    type=str,
+    default=REWE_DETAIL_CACHE_PATH,
+)
+parser.add_argument(
+    "--no_detail_cache",
+    help="Extract every detail page instead of using the detail cache",
+    action="store_true",
+    default=False,
+)
+parser.add_argument(
+    "--detail_cache_ttl_days",
+    help="Cached details older than this are extracted again",
+    type=float,
+    default=REWE_DETAIL_CACHE_TTL_DAYS,
+)
+parser.add_argument(
+    "--revalidate_detail_cache",
+    help="Keep expired cached details whose page did not change, "
+    "checked with ETag / Last-Modified",
+    action="store_true",
+    default=False,
+)
+parser.add_argument(
+    "--checkpoint_dir",
+    help="Where every scraped page and the progress are saved, "
+    "defaults to <output_path without extension>_parts",
+    type=str,
+    default=None,
+)
+parser.add_argument(
+    "--resume",
+    help="Continue an interrupted run from its checkpoint",
+    action="store_true",
+    default=False,
+)
+parser.add_argument(
+    "--request_rate",
+    help="Requests per second at the start, adapted to the page load times",
+    type=float,
+    default=1.0,
+)
+parser.add_argument(
+    "--max_request_rate",
+    help="Upper limit of the adaptive request rate",
+    type=float,
+    default=10.0,
+)
+parser.add_argument(
+    "--delta",
+    help="Fetch only the listing pages and save only the products that are new "
+    "or whose price, offer or grammage changed since the last delta crawl",
+    action="store_true",
+    default=False,
+)
+parser.add_argument(
+    "--snapshot_path",
+    help="Listing fields of all products seen by earlier delta crawls",
+    type=str,
+    default=REWE_SNAPSHOT_PATH,
+)
 args = parser.parse_args()
 
+throttle.configure(rate=args.request_rate, max_rate=args.max_request_rate)
+
+if args.output_path is None:
+    args.output_path = (
+        get_delta_output_path() if args.delta else "data/raw/rewe_dataset.csv"
+    )
+
+extract_details_enabled = args.extract_nutrition or args.extract_regulated_product_name
+if args.engine is None:
+    # Detail pages need the browser, as in the commands from before the http engine
+    args.engine = "selenium" if extract_details_enabled and not args.delta else "http"
+if args.engine == "http" and not args.delta and extract_details_enabled:
+    parser.error("Detail page extraction needs --engine selenium or --delta")
+if args.delta and extract_details_enabled and args.n_detail_workers == 0:
+    parser.error("Detail page extraction of a delta crawl needs --n_detail_workers")
 
-def main():
-    driver = load_driver(vars(args))
 
-    visited_category_names = []
-    page_dfs = []
-    n_categories = get_number_of_product_categories(driver)
+def make_detail_pool():
+    return DetailExtractionPool(
+        [load_driver(vars(args), open_url=False) for _ in range(args.n_detail_workers)],
+        base_url=args.url,
+        extract_nutrition=args.extract_nutrition,
+        extract_regulated_product_name=args.extract_regulated_product_name,
+        timeout=args.detail_timeout,
+    )
+
 
-    category_bar = tqdm.tqdm(
-        total=n_categories, desc="Product Categories", leave=True, position=0
+def make_detail_cache():
+    if args.no_detail_cache:
+        return None
+    return ReweDetailCache(
+        args.detail_cache_path,
+        ttl_days=args.detail_cache_ttl_days,
+        base_url=args.url,
+        revalidate=args.revalidate_detail_cache,
     )
 
-    while True:
-        next_category_name = go_to_next_category(driver, visited_category_names)
-        if next_category_name == False:
-            break
-        visited_category_names.append(next_category_name)
 
-        category_bar.update(1)
+def scrape_over_http():
+    with track_stage("scrape_rewe_online_shop") as record:
+        dfs = fetch_category_pages(
+            args.url,
+            max_concurrency=args.max_concurrency,
+            record_dir=args.record_dir,
+            parser=args.parser,
+        )
+        dfs.to_csv(args.output_path)
+        record.rows_out = len(dfs)
+    throttle.report()
 
-        n_pages = get_number_of_pages(driver)
 
-        page_bar = tqdm.tqdm(total=n_pages, desc="Pages", leave=False, position=1)
+def scrape_delta():
+    """
+    Daily price tracking: only the listing pages are fetched, and only new
+    and changed products are saved. Detail pages are only extracted for
+    products that no earlier delta crawl has seen, and products whose detail
+    pages failed are left out of the snapshot, so they are tried again.
+    """
+    with track_stage("scrape_rewe_online_shop_delta") as record:
+        dfs = fetch_category_pages(
+            args.url,
+            max_concurrency=args.max_concurrency,
+            record_dir=args.record_dir,
+            parser=args.parser,
+            with_detail_href=True,
+        )
+        snapshot = load_snapshot(args.snapshot_path)
+        changed_df = get_changed_products(dfs, snapshot)
+        is_new = (changed_df["Change"] == "new").to_numpy()
+        print(f"{is_new.sum()} new and {(~is_new).sum()} changed products")
 
-        i = 1
-        while True:
-            page_bar.update(1)
-            i += 1
+        if extract_details_enabled and is_new.any():
+            detail_keys = [
+                key
+                for key, enabled in [
+                    ("Regulated Product Name", args.extract_regulated_product_name),
+                    ("Nutritional Data", args.extract_nutrition),
+                ]
+                if enabled
+            ]
+            for key, value in get_empty_details(detail_keys).items():
+                changed_df.loc[is_new, key] = value
 
-            page_df = scrape_product_category_data_from_page(
-                driver=driver,
-                page_source=driver.page_source,
-                category=next_category_name,
-                extract_regulated_product_name=args.extract_regulated_product_name,
-                extract_nutrition=args.extract_nutrition,
-            )
+            # Without a detail href there is no detail page to extract
+            is_extracted = is_new & changed_df["Detail Href"].notna().to_numpy()
+            new_hrefs = changed_df.loc[is_extracted, "Detail Href"].tolist()
+            if new_hrefs:
+                detail_pool = make_detail_pool()
+                detail_cache = make_detail_cache()
+                details, is_complete = extract_details(
+                    new_hrefs, detail_pool, detail_cache
+                )
+                detail_pool.close()
+                if detail_cache is not None:
+                    detail_cache.close()
+                for key in detail_keys:
+                    changed_df.loc[is_extracted, key] = [
+                        detail[key] for detail in details
+                    ]
 
-            page_dfs.append(page_df)
+                # New products whose details failed stay new for the next crawl
+                failed_hrefs = [
+                    href
+                    for href, complete in zip(new_hrefs, is_complete)
+                    if not complete
+                ]
+                if failed_hrefs:
+                    print(f"Details of {len(failed_hrefs)} new products failed")
+                    dfs = dfs[~dfs["Detail Href"].isin(failed_hrefs)]
 
-            if go_next_page(driver) == False:
-                break
+        os.makedirs(os.path.dirname(args.output_path) or ".", exist_ok=True)
+        changed_df.reset_index(drop=True).to_csv(args.output_path)
+        update_snapshot(dfs, snapshot, args.snapshot_path)
+        record.rows_out = len(changed_df)
+    throttle.report()
+
+
+def main():
+    if args.delta:
+        scrape_delta()
+        return
+    if args.engine == "http":
+        scrape_over_http()
+        return
+
+    driver = load_driver(vars(args))
+    detail_pool = None
+    detail_cache = None
+    if extract_details_enabled:
+        if args.n_detail_workers > 0:
+            detail_pool = make_detail_pool()
+        detail_cache = make_detail_cache()
+
+    checkpoint = ScrapeCheckpoint(
+        args.checkpoint_dir or get_checkpoint_dir(args.output_path),
+        resume=args.resume,
+    )
+
+    with track_stage("scrape_rewe_online_shop") as record:
+        # Finished categories of an interrupted run are skipped
+        visited_category_names = checkpoint.finished_categories
+        n_categories = get_number_of_product_categories(driver)
+
+        category_bar = tqdm.tqdm(
+            total=n_categories,
+            initial=len(visited_category_names),
+            desc="Product Categories",
+            leave=True,
+            position=0,
+        )
 
         while True:
-            if go_back(driver) == False:
+            next_category_name = go_to_next_category(driver, visited_category_names)
+            if next_category_name == False:
                 break
+            visited_category_names.append(next_category_name)
+            n_finished_pages = checkpoint.get_n_finished_pages(next_category_name)
+            checkpoint.start_category(next_category_name)
+
+            category_bar.update(1)
+
+            n_pages = get_number_of_pages(driver)
+
+            page_bar = tqdm.tqdm(total=n_pages, desc="Pages", leave=False, position=1)
+
+            page = 1
+            while True:
+                page_bar.update(1)
+
+                # Pages saved before the interruption are only clicked through
+                if page > n_finished_pages:
+                    page_df = scrape_product_category_data_from_page(
+                        driver=driver,
+                        page_source=driver.page_source,
+                        category=next_category_name,
+                        extract_regulated_product_name=args.extract_regulated_product_name,
+                        extract_nutrition=args.extract_nutrition,
+                        detail_pool=detail_pool,
+                        detail_cache=detail_cache,
+                        parser=args.parser,
+                    )
+                    checkpoint.write_page(page_df, next_category_name, page)
+
+                if go_next_page(driver) == False:
+                    break
+                page += 1
+
+            checkpoint.finish_category(next_category_name)
+
+            while True:
+                if go_back(driver) == False:
+                    break
 
-    dfs = pd.concat(page_dfs, ignore_index=True)
-    dfs.to_csv(args.output_path)
-    dfs.reset_index(drop=True, inplace=True)
+        record.rows_out = checkpoint.assemble(args.output_path)
+    checkpoint.remove()
+    throttle.report()
+    if detail_pool is not None:
+        detail_pool.close()
+    if detail_cache is not None:
+        detail_cache.close()
     driver.close()
 
 
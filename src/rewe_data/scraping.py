@@ -10,6 +10,12 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 
+from src.rewe_data.listing_parsing import (
+    parse_listing_page_lxml,
+    get_number_of_pages_lxml,
+)
+from src.rewe_data.throttling import throttle
+
 
 def extract_product_data(product):
     product_dict = {
@@ -44,57 +50,71 @@ def extract_product_data(product):
     return product_dict
 
 
-from selenium.common.exceptions import TimeoutException, NoSuchElementException
+from selenium.common.exceptions import (
+    TimeoutException,
+    StaleElementReferenceException,
+    WebDriverException,
+)
 
+NO_NUTRITIONAL_DATA = "No nutritional data found"
 
-def extract_regulated_product_name_from_product(product, driver, waiting_time=0.1):
 
-    href = product.find("a", class_="search-service-productDetailsLink")["href"]
-    href_full = (
-        f"https://shop.rewe.de{href}"  # Assuming the base URL needs to be appended
-    )
+# Any element of the product detail page
+DETAIL_PAGE_XPATH = "//*[contains(@class, 'pdpr-')]"
 
-    # Use Selenium to find and click the link with the specific href
-    xpath = f"//a[@href='{href}']"  # Construct an XPath to find the link by its href attribute
-    product_link = WebDriverWait(driver, waiting_time).until(
-        EC.element_to_be_clickable((By.XPATH, xpath))
-    )
-    product_link.click()  # Click the link
 
-    # Wait for the new page to load and extract the regulated product name
+def is_detail_page_loaded(driver):
+    # The page finished loading and shows the product details
+    try:
+        return driver.execute_script(
+            "return document.readyState"
+        ) == "complete" and bool(driver.find_elements(By.XPATH, DETAIL_PAGE_XPATH))
+    except WebDriverException:
+        return False
+
+
+def read_regulated_product_name(driver, timeout=10):
+    """
+    Regulated product name on the product detail page the driver is showing.
+    None if it did not show up within the timeout, "" only if the page has
+    loaded completely and has no regulated name.
+    """
     try:
-        WebDriverWait(driver, waiting_time).until(
+        regulated_product_name_element = WebDriverWait(driver, timeout).until(
             EC.visibility_of_element_located(
                 (By.CLASS_NAME, "pdpr-RegulatedProductName")
             )
         )
-        regulated_product_name_element = driver.find_element(
-            By.CLASS_NAME, "pdpr-RegulatedProductName"
-        )
-        regulated_product_name = regulated_product_name_element.text
-    except (TimeoutException, NoSuchElementException):
-        regulated_product_name = ""
-    driver.back()
-    return regulated_product_name
-
+        return regulated_product_name_element.text
+    except TimeoutException:
+        return "" if is_detail_page_loaded(driver) else None
+    except StaleElementReferenceException:
+        return None
 
-def extract_nutritional_data_from_product(product, driver, waiting_time=1):
-    link = product.find("a", class_="search-service-productDetailsLink")["href"]
-    driver.execute_script("window.open(arguments[0]);", link)
-    driver.switch_to.window(driver.window_handles[-1])
 
+def read_nutrition_table(driver, timeout=10):
+    """
+    Nutrition table on the product detail page the driver is showing.
+    None if the heading, the table or its rows did not show up within the
+    timeout. NO_NUTRITIONAL_DATA only if the page has loaded completely and
+    has no nutrition heading, so a slow page is not mistaken for a product
+    without nutrition data.
+    """
     try:
-
-        WebDriverWait(driver, 10).until(
+        WebDriverWait(driver, timeout).until(
             EC.presence_of_element_located((By.XPATH, "//h2[contains(., 'Nährwerte')]"))
         )
-        nutrition_table = WebDriverWait(driver, waiting_time).until(
+    except TimeoutException:
+        return NO_NUTRITIONAL_DATA if is_detail_page_loaded(driver) else None
+
+    try:
+        nutrition_table = WebDriverWait(driver, timeout).until(
             EC.visibility_of_element_located((By.CLASS_NAME, "pdpr-NutritionTable"))
         )
         rows = nutrition_table.find_elements(By.TAG_NAME, "tr")
         table_data_string = ""
         for row in rows:
-            WebDriverWait(driver, 10).until(
+            WebDriverWait(driver, timeout).until(
                 EC.presence_of_element_located((By.TAG_NAME, "td"))
             )
             cells = row.find_elements(By.TAG_NAME, "td")
@@ -102,9 +122,58 @@ def extract_nutritional_data_from_product(product, driver, waiting_time=1):
                 cell.text.replace("\n", " ").replace("\r", "") for cell in cells
             ]
             table_data_string += ",".join(cell_texts) + "\n"
-            table_data_string
-    except:
-        table_data_string = "No nutritional data found"
+    except (TimeoutException, StaleElementReferenceException):
+        return None
+    return table_data_string
+
+
+def get_empty_details(detail_keys):
+    # Values of details that are missing or could not be read
+    empty_details = {
+        "Regulated Product Name": "",
+        "Nutritional Data": NO_NUTRITIONAL_DATA,
+    }
+    return {key: empty_details[key] for key in detail_keys}
+
+
+def complete_details(details, detail_keys):
+    """
+    Details with the empty value for every detail that could not be read
+    (None), and whether all details were read, so they can be cached.
+    """
+    empty_details = get_empty_details(detail_keys)
+    is_complete = details is not None and all(
+        details.get(key) is not None for key in detail_keys
+    )
+    details = details or {}
+    return {
+        key: details[key] if details.get(key) is not None else empty_details[key]
+        for key in detail_keys
+    }, is_complete
+
+
+def extract_regulated_product_name_from_product(href, driver, waiting_time=0.1):
+    # Use Selenium to find and click the link with the specific href
+    xpath = f"//a[@href='{href}']"  # Construct an XPath to find the link by its href attribute
+    product_link = WebDriverWait(driver, waiting_time).until(
+        EC.element_to_be_clickable((By.XPATH, xpath))
+    )
+    with throttle.request():
+        product_link.click()  # Click the link
+
+        # Wait for the new page to load and extract the regulated product name
+        regulated_product_name = read_regulated_product_name(driver)
+    throttle.acquire()
+    driver.back()
+    return regulated_product_name
+
+
+def extract_nutritional_data_from_product(href, driver, timeout=10):
+    with throttle.request():
+        driver.execute_script("window.open(arguments[0]);", href)
+        driver.switch_to.window(driver.window_handles[-1])
+
+        table_data_string = read_nutrition_table(driver, timeout=timeout)
 
     driver.close()
     driver.switch_to.window(driver.window_handles[0])
@@ -129,42 +198,131 @@ def extract_image_url(product):
         return None
 
 
+def parse_listing_page(page_source, category, parser="lxml", with_detail_href=False):
+    """
+    Product dicts of a category listing page, like
+    scrape_product_category_data_from_page without the detail pages.
+    parser="lxml" reads the fields with precompiled XPath expressions,
+    parser="bs4" with BeautifulSoup and extract_product_data.
+    """
+    if parser == "lxml":
+        return parse_listing_page_lxml(page_source, category, with_detail_href)
+
+    soup = BeautifulSoup(page_source, "html.parser")
+    product_dicts = []
+    for product in soup.find_all("div", class_="search-service-product"):
+        product_info = extract_product_data(product)
+        product_info["Image URL"] = extract_image_url(product)
+        product_info["Category"] = category
+        if with_detail_href:
+            link = product.find("a", class_="search-service-productDetailsLink")
+            product_info["Detail Href"] = link["href"] if link else None
+        product_dicts.append(product_info)
+    return product_dicts
+
+
+def get_number_of_pages_from_page_source(page_source, parser="lxml"):
+    """Number of pages in the pagination of a listing page, 1 without one."""
+    if parser == "lxml":
+        return get_number_of_pages_lxml(page_source)
+
+    soup = BeautifulSoup(page_source, "html.parser")
+    container = soup.find("div", class_="Pagination_paginationPagesContainer__b2Lv_")
+    if container is None:
+        return 1
+    page_numbers = [
+        int(button.get_text(strip=True))
+        for button in container.find_all("button")
+        if button.get_text(strip=True).isdigit()
+    ]
+    return max(page_numbers, default=1)
+
+
 def scrape_product_category_data_from_page(
     driver,
     page_source,
     category,
     extract_regulated_product_name=False,
     extract_nutrition=False,
+    detail_pool=None,
+    detail_cache=None,
+    parser="lxml",
 ):
+    """
+    The listing page the driver is showing is parsed with parse_listing_page,
+    like the pages of the http engine.
+    With a DetailExtractionPool, the detail pages of all products on the page
+    are queued at once and extracted in parallel instead of one at a time.
+    With a ReweDetailCache, products whose details are cached skip the detail
+    page, and newly extracted details are added to the cache.
+    """
     try:
         # Explicit wait for the products to load
-        element = WebDriverWait(driver, 20).until(
-            EC.presence_of_element_located((By.CLASS_NAME, "search-service-product"))
-        )
+        with throttle.request(acquire=False):
+            element = WebDriverWait(driver, 20).until(
+                EC.presence_of_element_located(
+                    (By.CLASS_NAME, "search-service-product")
+                )
+            )
     finally:
         # Now retrieve the page source
-        soup = BeautifulSoup(driver.page_source, "html.parser")
+        products = parse_listing_page(
+            driver.page_source, category, parser=parser, with_detail_href=True
+        )
 
     product_dicts = []
-    products = soup.find_all("div", class_="search-service-product")
+    hrefs = [product.pop("Detail Href") for product in products]
 
-    for product in tqdm.tqdm(products, desc="Processing Products", leave=False):
-        product_info = extract_product_data(product)
-        image_url = extract_image_url(product)
-        product_info["Image URL"] = image_url
+    detail_keys = []
+    if extract_regulated_product_name:
+        detail_keys.append("Regulated Product Name")
+    if extract_nutrition:
+        detail_keys.append("Nutritional Data")
 
-        if extract_regulated_product_name:
-            regulated_product_name = extract_regulated_product_name_from_product(
-                product, driver, waiting_time=0.1
-            )
-            product_info["Regulated Product Name"] = regulated_product_name
-        if extract_nutrition:
-            nutritional_data = extract_nutritional_data_from_product(
-                product, driver, waiting_time=0.1
-            )
-            product_info["Nutritional Data"] = nutritional_data
+    cached_details = [None] * len(products)
+    if detail_cache is not None and detail_keys:
+        cached_details = [
+            detail_cache.lookup(href, detail_keys) if href is not None else None
+            for href in hrefs
+        ]
+
+    if detail_pool is not None:
+        detail_futures = [
+            (detail_pool.submit(href) if details is None and href is not None else None)
+            for href, details in zip(hrefs, cached_details)
+        ]
+
+    for i, product_info in enumerate(
+        tqdm.tqdm(products, desc="Processing Products", leave=False)
+    ):
+        href = hrefs[i]
+        details = cached_details[i]
+        if details is None and detail_keys:
+            if href is None:
+                # Without a detail link there is no detail page to extract
+                details = None
+            elif detail_pool is not None:
+                details = detail_pool.get_result(detail_futures[i])
+            else:
+                details = {}
+                if extract_regulated_product_name:
+                    details["Regulated Product Name"] = (
+                        extract_regulated_product_name_from_product(
+                            href, driver, waiting_time=0.1
+                        )
+                    )
+                if extract_nutrition:
+                    details["Nutritional Data"] = extract_nutritional_data_from_product(
+                        href, driver
+                    )
+
+            # Timed out or failed pages are not cached, so they are tried again
+            details, is_complete = complete_details(details, detail_keys)
+            if detail_cache is not None and is_complete:
+                detail_cache.store(href, details)
+        if details is not None:
+            product_info.update(details)
 
-        product_info["Category"] = category
         product_dicts.append(product_info)
 
     df = pd.DataFrame(product_dicts)
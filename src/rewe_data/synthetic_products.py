@@ -0,0 +1,264 @@
+import os
+import re
+from html import escape
+
+import numpy as np
+import pandas as pd
+
+# (category, products, typical amounts, price range in euro)
+CATEGORY_PRODUCTS = [
+    (
+        "Obst & Gemüse",
+        ["Bananen", "Äpfel Elstar", "Zitronen", "Avocado", "Gurke", "Paprika rot"],
+        ["1kg", "500g", "2 Stück", "3 Stück", "6 Stück", "750 g", ""],
+        (0.49, 4.99),
+    ),
+    (
+        "Käse, Eier & Molkerei",
+        ["Vollmilch 3,5%", "Gouda jung", "Joghurt mild", "Freilandeier", "Butter"],
+        ["1l", "0,5l", "250g", "400 g", "10 Stück", "6 Stück", "150g"],
+        (0.79, 6.99),
+    ),
+    (
+        "Brot, Cerealien & Aufstriche",
+        ["Toastbrot", "Haferflocken", "Brötchen", "Nuss-Nougat-Creme", "Honig"],
+        ["500g", "750g", "4 Stück", "6 Stück", "350 g", "1kg"],
+        (0.89, 5.49),
+    ),
+    (
+        "Nudeln, Reis & Getreide",
+        ["Spaghetti", "Fusilli", "Basmati Reis", "Couscous", "Linsen"],
+        ["500g", "1kg", "4 x 125g", "250 g", "2,5kg"],
+        (0.69, 4.99),
+    ),
+    (
+        "Fleisch & Fisch",
+        ["Hähnchenbrustfilet", "Rinderhackfleisch", "Lachsfilet", "Wiener Würstchen"],
+        ["400g", "500 g", "1,2kg", "250g", "6 Stück"],
+        (2.49, 14.99),
+    ),
+    (
+        "Tiefkühl",
+        ["Pizza Margherita", "Rahmspinat", "Pommes Frites", "Fischstäbchen"],
+        ["350g", "750g", "1kg", "15 Stück", "2 Stück"],
+        (1.29, 5.99),
+    ),
+    # Categories that are dropped while cleaning
+    (
+        "Getränke & Genussmittel",
+        ["Mineralwasser", "Apfelschorle", "Orangensaft"],
+        ["1,5l", "0,75 l", "6 x 1,5l", "1l"],
+        (0.39, 3.99),
+    ),
+    (
+        "Angebote",
+        ["Kaffee Crema", "Schokolade Vollmilch"],
+        ["1kg", "100g"],
+        (0.99, 12.99),
+    ),
+]
+
+BRANDS = [
+    "REWE Bio",
+    "REWE Beste Wahl",
+    "ja!",
+    "REWE",
+    "Bio",
+    "UNSER LAND",
+    "Alnatura",
+    "Barilla",
+    "Dr. Oetker",
+    "Kerrygold",
+    "Landliebe",
+    "",
+]
+PACKAGING_WORDS = [
+    "",
+    "",
+    "",
+    " im Netz",
+    " im Beutel",
+    " im Kochbeutel",
+    " im Glas",
+    " im Topf",
+    " aus der Region",
+]
+STUECK_WEIGHTS = {
+    "Bananen": 120,
+    "Avocado": 200,
+    "Gurke": 400,
+    "Zitronen": 100,
+    "Brötchen": 60,
+    "Freilandeier": 60,
+    "Wiener Würstchen": 50,
+}
+
+
+def format_euros(euros):
+    return f"{euros:.2f}".replace(".", ",") + " €"
+
+
+def get_grammage(amount, price):
+    """Grammage text like on the REWE product tiles, e.g. '500g (1 kg = 3,98 €)'."""
+    if amount == "":
+        return "Grammage not found"
+    if "Stück" in amount:
+        n_pieces = int(amount.split()[0])
+        return f"{amount} (1 Stück = {format_euros(price / n_pieces)})"
+    return f"{amount} (1 kg = {format_euros(price * 2)})"
+
+
+def generate_product_catalog(n_products, rng):
+    rows = []
+    for _ in range(n_products):
+        category, products, amounts, (low, high) = CATEGORY_PRODUCTS[
+            rng.integers(len(CATEGORY_PRODUCTS))
+        ]
+        brand = BRANDS[rng.integers(len(BRANDS))]
+        product = products[rng.integers(len(products))]
+        packaging = PACKAGING_WORDS[rng.integers(len(PACKAGING_WORDS))]
+        amount = amounts[rng.integers(len(amounts))]
+        # "ca." in front of loose products, amounts in the name or only in grammage
+        if amount and rng.random() < 0.1:
+            amount = f"ca. {amount}"
+        name_amount = amount if rng.random() < 0.7 else ""
+
+        name = " ".join(
+            part for part in [brand, product + packaging, name_amount] if part
+        )
+        price = round(rng.uniform(low, high), 2)
+        rows.append(
+            {
+                "Name": name,
+                "Price": format_euros(price),
+                "Grammage": get_grammage(amount.replace("ca. ", ""), price),
+                "Category": category,
+            }
+        )
+    return pd.DataFrame(rows)
+
+
+def generate_synthetic_rewe_scrape(n_rows, n_products=None, seed=0):
+    """
+    Generate a raw REWE scrape with the columns written by
+    scrape_rewe_online_shop.py: product names with brands, packaging words,
+    'x Stück' counts and kg/g/l/ml amounts with comma decimals, euro prices,
+    grammage texts and categories.
+
+    Rows are drawn from a catalog of n_products products (n_rows / 4 by
+    default), so like concatenated scrape snapshots, products repeat,
+    some of them with an offer price.
+    """
+    rng = np.random.default_rng(seed)
+    n_products = n_products or max(n_rows // 4, 1)
+    catalog = generate_product_catalog(n_products, rng)
+
+    df = catalog.iloc[rng.integers(len(catalog), size=n_rows)].reset_index(drop=True)
+    df["IsOffer"] = rng.random(n_rows) < 0.15
+    df.loc[df["IsOffer"], "Price"] = [
+        format_euros(round(rng.uniform(0.39, 9.99), 2))
+        for _ in range(df["IsOffer"].sum())
+    ]
+    df["Table Data"] = None
+    df["Image URL"] = [
+        f"https://img.rewe-static.de/{code}/product.jpg"
+        for code in rng.integers(1_000_000, 9_999_999, size=n_rows)
+    ]
+    return df[
+        ["Name", "Price", "Grammage", "IsOffer", "Category", "Table Data", "Image URL"]
+    ]
+
+
+def generate_weights_per_stueck_list():
+    # Same layout as data/raw/rewe_weights_per_stueck_list.json
+    return [
+        {"Name": name, "Weight (g)": weight} for name, weight in STUECK_WEIGHTS.items()
+    ]
+
+
+def get_category_slug(category):
+    slug = category.lower().translate(
+        str.maketrans({"ä": "ae", "ö": "oe", "ü": "ue", "ß": "ss"})
+    )
+    return re.sub(r"[^a-z0-9]+", "-", slug).strip("-")
+
+
+def render_product_tile(product, detail_href):
+    price_class = (
+        "search-service-productOfferPrice"
+        if product["IsOffer"]
+        else "search-service-productPrice"
+    )
+    return f"""
+<div class="search-service-product search-service-productTile">
+  <a class="search-service-productDetailsLink" href="{escape(detail_href)}">
+    <div class="search-service-productPicture">
+      <img alt="{escape(product['Name'])}" src="{escape(product['Image URL'])}" loading="lazy">
+    </div>
+  </a>
+  <div class="ProductDetailsWrapper_productDetails">
+    <h4 class="ProductDetailsWrapper_productTitle__XjgsA">
+      {escape(product['Name'])}
+    </h4>
+    <div class="ProductGrammage_productGrammage__fMOJr">
+      {escape(product['Grammage'])}
+    </div>
+    <div class="search-service-productPriceContainer">
+      <div class="{price_class}">{escape(product['Price'])}</div>
+    </div>
+  </div>
+</div>"""
+
+
+def render_listing_page(products, page, n_pages):
+    # The index of a product is its id in the detail href
+    tiles = "".join(
+        render_product_tile(product, f"/p/{product_id}")
+        for product_id, product in products.iterrows()
+    )
+    buttons = "".join(
+        f'<button aria-label="{i}">{i}</button>' for i in range(1, n_pages + 1)
+    )
+    return f"""<!DOCTYPE html>
+<html lang="de"><head><meta charset="utf-8"><title>REWE Seite {page}</title></head>
+<body>
+<div class="search-service-productList">{tiles}
+</div>
+<div class="Pagination_paginationPagesContainer__b2Lv_">{buttons}</div>
+</body></html>
+"""
+
+
+def write_synthetic_listing_pages(record_dir, n_rows, products_per_page=40, seed=0):
+    """
+    Write a synthetic scrape as shop pages in the layout of
+    http_fetching.get_fixture_path: the home page with the category tiles
+    and the listing pages of every category, to replay with
+    fixture_server.py or to benchmark the listing parsers.
+    Returns the number of listing pages.
+    """
+    df = generate_synthetic_rewe_scrape(n_rows, seed=seed)
+    # Every row is its own product with its own detail page
+    df["Name"] = df["Name"] + [f" #{i}" for i in range(len(df))]
+
+    n_listing_pages = 0
+    tiles = []
+    for category, products in df.groupby("Category", sort=False):
+        slug = get_category_slug(category)
+        tiles.append(
+            f'<a class="home-page-category-tile" aria-label="{escape(category)}" '
+            f'href="/c/{slug}/">{escape(category)}</a>'
+        )
+        n_pages = -(-len(products) // products_per_page)
+        os.makedirs(os.path.join(record_dir, "c", slug), exist_ok=True)
+        for page in range(1, n_pages + 1):
+            start = (page - 1) * products_per_page
+            page_products = products.iloc[start : start + products_per_page]
+            path = os.path.join(record_dir, "c", slug, f"page_{page}.html")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(render_listing_page(page_products, page, n_pages))
+        n_listing_pages += n_pages
+
+    with open(os.path.join(record_dir, "page_1.html"), "w", encoding="utf-8") as f:
+        f.write(f"<html><body>{''.join(tiles)}</body></html>\n")
+    return n_listing_pages
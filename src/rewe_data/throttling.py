@@ -0,0 +1,128 @@
+import time
+import asyncio
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+
+class AdaptiveThrottle:
+    """
+    Token bucket whose refill rate adapts to the server (AIMD): every fast,
+    successful page load adds increase requests/s to the rate, every slow
+    load, timeout or error page multiplies it by decrease. Requests wait for
+    a token instead of a fixed random sleep, so the crawl speeds up while
+    the shop answers quickly and backs off as soon as it starts to struggle.
+
+    Thread-safe, and usable from asyncio with acquire_async.
+    """
+
+    def __init__(
+        self,
+        rate=1.0,
+        min_rate=0.1,
+        max_rate=10.0,
+        increase=0.1,
+        decrease=0.5,
+        slow_latency=5.0,
+        burst=1,
+        window=1000,
+    ):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.slow_latency = slow_latency
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+        self.latencies = deque(maxlen=window)
+        self.n_requests = 0
+        self.n_failures = 0
+        self.lock = threading.Lock()
+
+    def configure(self, **kwargs):
+        for key, value in kwargs.items():
+            if value is not None:
+                setattr(self, key, value)
+
+    def reserve(self):
+        # Take a token, returns how long to wait until it is available
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.updated_at) * self.rate
+            )
+            self.updated_at = now
+            self.tokens -= 1
+            return max(-self.tokens / self.rate, 0.0)
+
+    def acquire(self):
+        time.sleep(self.reserve())
+
+    async def acquire_async(self):
+        await asyncio.sleep(self.reserve())
+
+    def record(self, latency, ok=True):
+        with self.lock:
+            self.n_requests += 1
+            self.latencies.append(latency)
+            if ok and latency < self.slow_latency:
+                self.rate = min(self.rate + self.increase, self.max_rate)
+            else:
+                self.n_failures += ok is False
+                self.rate = max(self.rate * self.decrease, self.min_rate)
+
+    @contextmanager
+    def request(self, acquire=True):
+        """
+        Wait for a token, then time the block. An exception inside the block
+        counts as a failed request. With acquire=False the block is only
+        timed, e.g. to wait for a page that an earlier click started loading.
+
+        with throttle.request():
+            WebDriverWait(driver, 10).until(...)
+        """
+        if acquire:
+            self.acquire()
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.record(time.perf_counter() - start, ok=False)
+            raise
+        self.record(time.perf_counter() - start)
+
+    def get_latency_percentiles(self, percentiles=(50, 90, 99)):
+        with self.lock:
+            latencies = list(self.latencies)
+        if not latencies:
+            return {}
+        return {
+            f"p{percentile}": float(value)
+            for percentile, value in zip(
+                percentiles, np.percentile(latencies, percentiles)
+            )
+        }
+
+    def report(self):
+        stats = {
+            "rate": self.rate,
+            "n_requests": self.n_requests,
+            "n_failures": self.n_failures,
+            **self.get_latency_percentiles(),
+        }
+        print(
+            "Throttle: "
+            + ", ".join(
+                f"{key} {value:.3f}" if isinstance(value, float) else f"{key} {value}"
+                for key, value in stats.items()
+            )
+        )
+        return stats
+
+
+# Shared by the navigation, scraping and fetching helpers of one crawl
+throttle = AdaptiveThrottle()
@@ -0,0 +1,39 @@
+import pandas as pd
+import pytest
+
+from src.rewe_data.cleaning import compile_name_patterns, remove_patterns
+
+NAME_PATTERNS = [r"ja!\s*", r"\bBio\b", r"\bREWE\b", r"\bim Glas\b"]
+
+
+def clean_names(names, name_patterns=NAME_PATTERNS):
+    return remove_patterns(pd.DataFrame({"Name": names}), name_patterns)[
+        "Name"
+    ].tolist()
+
+
+@pytest.mark.parametrize(
+    "name, expected",
+    [
+        ("Milch-Bio-Joghurt", "Milch--Joghurt"),
+        ("Karotten,Bio,lose", "Karotten,,lose"),
+        ("(Bio) Eier", "() Eier"),
+        ("ja!Milch", "Milch"),
+        ("Milch Bio-Joghurt", "Milch -Joghurt"),
+        ("REWE Bio Milch im Glas 1l", "Milch 1l"),
+        ("  Milch   1l ", "Milch 1l"),
+    ],
+)
+def test_remove_patterns_next_to_punctuation(name, expected):
+    assert clean_names([name]) == [expected]
+
+
+@pytest.mark.parametrize("name_patterns", [[], None])
+def test_remove_patterns_without_patterns_only_collapses_whitespace(name_patterns):
+    assert clean_names(["Milch  1l"], name_patterns) == ["Milch 1l"]
+
+
+@pytest.mark.parametrize("pattern", ["a*", "x|", "(?:foo)?", r"\b", "(?=Bio)"])
+def test_compile_name_patterns_rejects_empty_matches(pattern):
+    with pytest.raises(ValueError):
+        compile_name_patterns([r"\bBio\b", pattern])